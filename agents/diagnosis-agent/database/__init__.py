@@ -1,2 +1,4 @@
 ﻿from database.build_index import build_all_index, gather_medical_dataset
-from database.elasticsearch_retriever import ElasticsearchRetriever
\ No newline at end of file
+from database.elasticsearch_retriever import ElasticsearchRetriever
+from database.es_client import get_es_client, close_es_client, es_health_stats
+from database.symptom_matrix_retriever import SymptomMatrixRetriever, symptom_matrix_retriever
\ No newline at end of file
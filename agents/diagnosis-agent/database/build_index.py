@@ -1,45 +1,167 @@
-﻿import logging
+﻿import asyncio
+import logging
+import time
 from datasets import load_dataset
-from typing import List, Dict
-from elasticsearch import Elasticsearch
+from typing import Dict, Iterable, Iterator, Tuple
+from elasticsearch.helpers import async_streaming_bulk
 from helpers import env_helper
+from database.es_client import get_es_client
 from database.elasticsearch_retriever import ElasticsearchRetriever
+from database.symptom_matrix_retriever import symptom_matrix_retriever
+from database.dataset_snapshot import export_snapshot, read_snapshot, snapshot_exists
+from database.index_versioning import alias_exists, promote_version, versioned_index_name
 
-client = Elasticsearch(env_helper.ELASTIC_HOST)
 logging = logging.getLogger(__name__)
 
-def gather_medical_dataset():
-    ds = load_dataset("QuyenAnhDE/Diseases_Symptoms")
-    dataset = ds['train']
-    documents = []
+def stream_medical_dataset() -> Iterator[Dict]:
+    """Stream the medical dataset from the Hugging Face Hub row by row"""
+    dataset = load_dataset("QuyenAnhDE/Diseases_Symptoms", split="train", streaming=True)
     for row in dataset:
-        print(row)
-        documents.append(row)
+        yield row
 
-    return documents
+def gather_medical_dataset() -> Iterator[Dict]:
+    """
+    Yield the medical dataset rows from the local snapshot, exporting the
+    snapshot from the Hub first when it does not exist yet. With
+    MEDICAL_SNAPSHOT_PATH empty the dataset is always streamed from the Hub.
+    """
+    snapshot_path = env_helper.MEDICAL_SNAPSHOT_PATH
+    if not snapshot_path:
+        yield from stream_medical_dataset()
+        return
+
+    if not snapshot_exists(snapshot_path):
+        logging.info(f"No dataset snapshot at {snapshot_path}, exporting it from the Hub")
+        export_snapshot(stream_medical_dataset(), snapshot_path)
+
+    yield from read_snapshot(snapshot_path)
 
-def insert_documents(index: str, documents: List[Dict]):
-    operations = []
+def generate_actions(index: str, documents: Iterable[Dict]) -> Iterator[Dict]:
     for document in documents:
-        operations.append({'index': {'_index': index}})
-        operations.append(document)
+        yield {'_index': index, '_source': document}
+
+class BulkProgress:
+    """Counts bulk results and reports errors and docs/sec for every chunk"""
+    def __init__(self, index: str, chunk_size: int):
+        self.index = index
+        self.chunk_size = chunk_size
+        self.start_time = time.perf_counter()
+        self.indexed, self.failed = 0, 0
+        self.chunk_number, self.chunk_indexed, self.chunk_errors = 0, 0, []
+
+    def record(self, ok: bool, info: Dict):
+        if ok:
+            self.indexed += 1
+            self.chunk_indexed += 1
+        else:
+            self.failed += 1
+            self.chunk_errors.append(info)
+
+        if self.chunk_indexed + len(self.chunk_errors) == self.chunk_size:
+            self.report_chunk()
+
+    def report_chunk(self):
+        if not self.chunk_indexed and not self.chunk_errors:
+            return
+
+        self.chunk_number += 1
+        elapsed = time.perf_counter() - self.start_time
+        docs_per_second = (self.indexed + self.failed) / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"Chunk {self.chunk_number} into {self.index}: {self.chunk_indexed} indexed, {len(self.chunk_errors)} failed "
+            f"({self.indexed + self.failed} total, {docs_per_second:.0f} docs/sec)"
+        )
+        if self.chunk_errors:
+            logging.error(f"First errors of chunk {self.chunk_number}: {self.chunk_errors[:5]}")
+
+        self.chunk_indexed, self.chunk_errors = 0, []
+
+async def insert_documents(index: str, documents: Iterable[Dict]) -> Tuple[int, int]:
+    """
+    Stream documents into index in chunks of INDEX_CHUNK_SIZE, keeping up to
+    INDEX_BULK_CONCURRENCY bulk requests in flight on the shared client.
+    Errors and throughput are reported for every chunk.
+
+    Returns:
+        tuple: The number of indexed and failed documents.
+    """
+    client = get_es_client()
+    chunk_size = env_helper.INDEX_CHUNK_SIZE
+    concurrency = max(1, env_helper.INDEX_BULK_CONCURRENCY)
+    actions = generate_actions(index, documents)
+    progress = BulkProgress(index, chunk_size)
+
+    async def consume(source):
+        async for ok, info in async_streaming_bulk(
+            client, source,
+            chunk_size=chunk_size,
+            raise_on_error=False,
+            raise_on_exception=False
+        ):
+            progress.record(ok, info)
 
-    client.bulk(operations=operations)
+    if concurrency == 1:
+        await consume(actions)
+    else:
+        # One producer feeds a bounded queue that several bulk streams drain
+        queue: asyncio.Queue = asyncio.Queue(maxsize=chunk_size * concurrency)
 
-def build_medical_index():
-    if client.indices.exists(index=env_helper.MEDICAL_INDEX):
+        async def produce():
+            for action in actions:
+                await queue.put(action)
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        async def queued_actions():
+            while (action := await queue.get()) is not None:
+                yield action
+
+        await asyncio.gather(produce(), *(consume(queued_actions()) for _ in range(concurrency)))
+
+    progress.report_chunk()
+
+    elapsed = time.perf_counter() - progress.start_time
+    logging.info(f"Indexed {progress.indexed} documents into {index} in {elapsed:.2f}s, {progress.failed} failed")
+    return progress.indexed, progress.failed
+
+async def build_medical_index(rebuild: bool = False):
+    """
+    Build the medical dataset into a new versioned index and atomically move
+    the MEDICAL_INDEX alias onto it, so searches never see a missing or half
+    built index. Skips when the alias already exists unless rebuild is set.
+    """
+    client = get_es_client()
+    alias = env_helper.MEDICAL_INDEX
+    if await alias_exists(client, alias) and not rebuild:
         logging.info("Medical index already exists")
         return
 
-    logging.info("Building medical index")
-    documents = gather_medical_dataset()
-    insert_documents(env_helper.MEDICAL_INDEX, documents)
+    new_index = versioned_index_name(alias)
+    logging.info(f"Building medical index version {new_index}")
+    await client.indices.create(index=new_index)
 
-def test_index():
-    result = ElasticsearchRetriever.search_all(env_helper.MEDICAL_INDEX)
-    print(result)
+    indexed, failed = await insert_documents(new_index, gather_medical_dataset())
+    if failed:
+        logging.error(f"{failed} documents failed to index into {new_index}, keeping the current version")
+        await client.indices.delete(index=new_index)
+        return
+
+    if await promote_version(client, alias, new_index, expected=indexed, keep=env_helper.INDEX_KEEP_VERSIONS):
+        ElasticsearchRetriever.invalidate(alias)
+
+async def test_index():
+    result = await ElasticsearchRetriever.search_all(env_helper.MEDICAL_INDEX)
+    logging.debug(f"First hits: {[hit['_source']['Name'] for hit in result['hits']['hits']]}")
+
+def load_symptom_matrix():
+    logging.info("Loading medical dataset into the in-process symptom matrix")
+    symptom_matrix_retriever.load(gather_medical_dataset(), column="Symptoms")
+
+async def build_all_index():
+    if env_helper.RETRIEVER_BACKEND == "embedded":
+        load_symptom_matrix()
+        return
 
-def build_all_index():
     logging.info("Building all index for the application")
-    build_medical_index()
-    # test_index()
\ No newline at end of file
+    await build_medical_index()
+    # await test_index()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import logging
+import os
+import pyarrow as pa
+from typing import Dict, Iterable, Iterator, List
+
+logging = logging.getLogger(__name__)
+
+def export_snapshot(rows: Iterable[Dict], path: str, batch_size: int = 1000) -> int:
+    """
+    Write rows to an Arrow IPC file at path, batch by batch.
+
+    The file is written next to path first and moved into place once it is
+    complete, so a crash never leaves a half written snapshot behind.
+
+    Returns:
+        int: The number of rows written.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temporary_path = f"{path}.tmp"
+    writer: pa.ipc.RecordBatchFileWriter | None = None
+    schema: pa.Schema | None = None
+    total_rows = 0
+    batch: List[Dict] = []
+
+    def write_batch():
+        nonlocal writer, schema
+        record_batch = pa.RecordBatch.from_pylist(batch, schema=schema)
+        if writer is None:
+            schema = record_batch.schema
+            writer = pa.ipc.new_file(temporary_path, schema)
+        writer.write_batch(record_batch)
+
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                write_batch()
+                total_rows += len(batch)
+                batch = []
+
+        if batch:
+            write_batch()
+            total_rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        raise ValueError("Refusing to write an empty dataset snapshot")
+
+    os.replace(temporary_path, path)
+    logging.info(f"Wrote {total_rows} rows to dataset snapshot {path}")
+    return total_rows
+
+def read_snapshot(path: str) -> Iterator[Dict]:
+    """
+    Memory-map the Arrow snapshot at path and yield its rows. Only one record
+    batch is converted to Python objects at a time.
+    """
+    with pa.memory_map(path, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield from reader.get_batch(i).to_pylist()
+
+def snapshot_exists(path: str) -> bool:
+    return bool(path) and os.path.isfile(path)
@@ -1,13 +1,48 @@
-﻿from elasticsearch import Elasticsearch
+﻿import logging
+from typing import Dict, List, Sequence, Tuple
+from database.es_client import get_es_client
 from helpers import env_helper
+from helpers.lru_cache import LRUCache
+from helpers.metrics import register_cache
 
-es = Elasticsearch(env_helper.ELASTIC_HOST)
+logging = logging.getLogger(__name__)
 
 class ElasticsearchRetriever:
+    cache = LRUCache(
+        max_entries=env_helper.RETRIEVAL_CACHE_MAX_ENTRIES,
+        ttl_seconds=env_helper.RETRIEVAL_CACHE_TTL_SECONDS
+    )
+    register_cache("retrieval", cache.stats)
+
+    @staticmethod
+    def normalize_query(query: str) -> Tuple[str, ...]:
+        """
+        Normalize a comma separated symptom list so the same symptoms in a
+        different order, casing or with duplicates share a cache entry.
+        """
+        terms = {term.strip().lower() for term in query.split(',')}
+        terms.discard('')
+        return tuple(sorted(terms))
+
+    @staticmethod
+    def invalidate(index: str | None = None):
+        """Drop the cached results of index, or of every index when none is given"""
+        if index is None:
+            ElasticsearchRetriever.cache.clear()
+            return
+
+        ElasticsearchRetriever.cache.clear(lambda key: key[0] == index)
+
     @staticmethod
-    def search(index: str, query: str, total_result: int, column: str):
-        print("Searching not from cache")
-        query_result = es.search(
+    async def search(index: str, query: str, total_result: int, column: str):
+        cache_key = (index, column, total_result, ElasticsearchRetriever.normalize_query(query))
+        hits = ElasticsearchRetriever.cache.get(cache_key)
+        if hits is not None:
+            logging.debug(f"Serving '{query}' from the retrieval cache")
+            return list(hits)
+
+        # index is the read alias, so a reindex behind it is never visible half built
+        query_result = await get_es_client().search(
             index=index,
             size=total_result,
             query={
@@ -18,15 +53,58 @@ class ElasticsearchRetriever:
         )
 
         hits = query_result['hits']['hits']
-        return hits
+        ElasticsearchRetriever.cache.set(cache_key, hits)
+        return list(hits)
+
+    @staticmethod
+    async def search_many(index: str, queries: Sequence[str], total_result: int, column: str) -> List[List[Dict] | None]:
+        """
+        Run several match queries in a single _msearch round trip. Cached
+        queries are answered locally and only the misses are sent.
+
+        Returns:
+            list: The hits of every query in order, or None for a query that failed.
+        """
+        results: List[List[Dict] | None] = [None] * len(queries)
+        misses: Dict[Tuple, List[int]] = {}
+
+        for position, query in enumerate(queries):
+            cache_key = (index, column, total_result, ElasticsearchRetriever.normalize_query(query))
+            hits = ElasticsearchRetriever.cache.get(cache_key)
+            if hits is not None:
+                results[position] = list(hits)
+            else:
+                misses.setdefault(cache_key, []).append(position)
+
+        if not misses:
+            return results
+
+        searches = []
+        for positions in misses.values():
+            searches.append({'index': index})
+            searches.append({'size': total_result, 'query': {'match': {column: queries[positions[0]]}}})
+
+        response = await get_es_client().msearch(searches=searches)
+        for (cache_key, positions), item in zip(misses.items(), response['responses']):
+            if 'error' in item:
+                logging.error(f"Search for '{queries[positions[0]]}' failed: {item['error']}")
+                continue
+
+            hits = item['hits']['hits']
+            ElasticsearchRetriever.cache.set(cache_key, hits)
+            for position in positions:
+                results[position] = list(hits)
+
+        return results
 
     @staticmethod
-    def search_all(index: str):
-        res = es.search(
+    async def search_all(index: str) -> Dict:
+        res = await get_es_client().search(
             index=index,
             query={
                 "match_all": {}
             }
         )
 
-        print(res)
\ No newline at end of file
+        logging.info(f"{index} holds {res['hits']['total']['value']} documents")
+        return res
\ No newline at end of file
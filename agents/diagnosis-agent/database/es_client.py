@@ -0,0 +1,52 @@
+import time
+from typing import Any, Dict
+from elasticsearch import AsyncElasticsearch
+from helpers import env_helper
+
+_client: AsyncElasticsearch | None = None
+
+def get_es_client() -> AsyncElasticsearch:
+    """
+    The one pooled AsyncElasticsearch client of this agent. Connections are
+    kept alive and reused by every caller, up to ES_CONNECTIONS_PER_NODE per node.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncElasticsearch(
+            env_helper.ELASTIC_HOST,
+            connections_per_node=env_helper.ES_CONNECTIONS_PER_NODE,
+            request_timeout=env_helper.ES_REQUEST_TIMEOUT,
+            max_retries=env_helper.ES_MAX_RETRIES,
+            retry_on_timeout=True,
+            http_compress=True,
+        )
+
+    return _client
+
+async def close_es_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+async def es_health_stats() -> Dict[str, Any]:
+    """Pool configuration and a timed round trip to the cluster health API"""
+    stats: Dict[str, Any] = {
+        "connections_per_node": env_helper.ES_CONNECTIONS_PER_NODE,
+        "max_retries": env_helper.ES_MAX_RETRIES,
+        "request_timeout": env_helper.ES_REQUEST_TIMEOUT,
+    }
+
+    start = time.perf_counter()
+    try:
+        health = await get_es_client().cluster.health()
+        stats["cluster_status"] = health["status"]
+        stats["nodes"] = health["number_of_nodes"]
+        stats["data_nodes"] = health["number_of_data_nodes"]
+        stats["unassigned_shards"] = health["unassigned_shards"]
+    except Exception as e:
+        stats["cluster_status"] = "unreachable"
+        stats["error"] = str(e)
+    stats["health_latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    return stats
@@ -0,0 +1,78 @@
+import logging
+from datetime import datetime, timezone
+from typing import List
+from elasticsearch import AsyncElasticsearch
+
+logging = logging.getLogger(__name__)
+
+def versioned_index_name(alias: str) -> str:
+    """A new, timestamped concrete index name for alias"""
+    return f"{alias}-v{datetime.now(timezone.utc):%Y%m%d%H%M%S%f}"
+
+async def list_versions(client: AsyncElasticsearch, alias: str) -> List[str]:
+    """Every versioned index built for alias, oldest first"""
+    indices = await client.indices.get(index=f"{alias}-v*", expand_wildcards="open")
+    return sorted(indices.keys())
+
+async def get_alias_targets(client: AsyncElasticsearch, alias: str) -> List[str]:
+    if not await client.indices.exists_alias(name=alias):
+        return []
+
+    aliases = await client.indices.get_alias(name=alias)
+    return list(aliases.keys())
+
+async def alias_exists(client: AsyncElasticsearch, alias: str) -> bool:
+    return bool(await client.indices.exists_alias(name=alias))
+
+async def is_legacy_index(client: AsyncElasticsearch, alias: str) -> bool:
+    """True when alias is taken by a concrete index from before versioning"""
+    return bool(await client.indices.exists(index=alias)) and not await alias_exists(client, alias)
+
+async def verify_doc_count(client: AsyncElasticsearch, index: str, expected: int) -> bool:
+    await client.indices.refresh(index=index)
+    count = (await client.count(index=index))['count']
+    if count != expected:
+        logging.error(f"Index {index} holds {count} documents, expected {expected}")
+        return False
+
+    return True
+
+async def swap_alias(client: AsyncElasticsearch, alias: str, new_index: str):
+    """
+    Atomically point alias at new_index. A legacy concrete index that still
+    occupies the alias name is removed in the same request.
+    """
+    actions = [{'remove': {'index': index, 'alias': alias}} for index in await get_alias_targets(client, alias)]
+    if await is_legacy_index(client, alias):
+        actions.append({'remove_index': {'index': alias}})
+    actions.append({'add': {'index': new_index, 'alias': alias}})
+
+    await client.indices.update_aliases(actions=actions)
+    logging.info(f"Alias {alias} now points to {new_index}")
+
+async def collect_garbage(client: AsyncElasticsearch, alias: str, keep: int):
+    """Delete old versions of alias, keeping the live one and the newest `keep` before it"""
+    live = set(await get_alias_targets(client, alias))
+    previous = [index for index in await list_versions(client, alias) if index not in live]
+    stale = previous[:-keep] if keep > 0 else previous
+
+    for index in stale:
+        logging.info(f"Deleting stale index version {index}")
+        await client.indices.delete(index=index)
+
+async def promote_version(client: AsyncElasticsearch, alias: str, new_index: str, expected: int, keep: int) -> bool:
+    """
+    Move alias to new_index once its document count matches expected, then
+    garbage collect old versions. A version that fails verification is
+    deleted and the alias keeps serving the previous one.
+
+    Returns:
+        bool: Whether the alias was moved.
+    """
+    if not await verify_doc_count(client, new_index, expected):
+        await client.indices.delete(index=new_index)
+        return False
+
+    await swap_alias(client, alias, new_index)
+    await collect_garbage(client, alias, keep)
+    return True
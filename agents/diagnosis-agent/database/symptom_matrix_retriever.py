@@ -0,0 +1,138 @@
+import re
+import numpy as np
+from scipy import sparse
+from typing import Dict, Iterable, List, Sequence
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens, close to what Elasticsearch's standard analyzer produces"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class SymptomMatrixRetriever:
+    """
+    In-process replacement for the Elasticsearch `match` query on the medical index.
+
+    The dataset is loaded once into a sparse document x term matrix holding
+    BM25 weights, so scoring a batch of queries is a single sparse matrix
+    multiply and the top results are picked with argpartition.
+
+    Args:
+        k1 (float): BM25 term frequency saturation, same default as Elasticsearch.
+        b (float): BM25 length normalization, same default as Elasticsearch.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.column: str | None = None
+        self.sources: List[Dict] = []
+        self.vocabulary: Dict[str, int] = {}
+        self.weights: sparse.csr_matrix | None = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.weights is not None
+
+    def load(self, rows: Iterable[Dict], column: str = "Symptoms"):
+        """Build the BM25 weight matrix from the dataset rows, scoring on column"""
+        sources: List[Dict] = []
+        vocabulary: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[int] = []
+
+        for row in rows:
+            term_counts: Dict[int, int] = {}
+            for token in tokenize(row.get(column) or ""):
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                term_counts[term_id] = term_counts.get(term_id, 0) + 1
+
+            indices.extend(term_counts.keys())
+            counts.extend(term_counts.values())
+            indptr.append(len(indices))
+            sources.append(dict(row))
+
+        term_frequencies = sparse.csr_matrix(
+            (np.asarray(counts, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(sources), len(vocabulary))
+        )
+
+        self.column = column
+        self.sources = sources
+        self.vocabulary = vocabulary
+        self.weights = self._bm25_weights(term_frequencies)
+
+    def _bm25_weights(self, term_frequencies: sparse.csr_matrix) -> sparse.csr_matrix:
+        total_documents = term_frequencies.shape[0]
+        document_lengths = np.asarray(term_frequencies.sum(axis=1)).ravel()
+        average_length = document_lengths.mean() if total_documents else 0.0
+
+        document_frequencies = np.bincount(term_frequencies.indices, minlength=term_frequencies.shape[1])
+        idf = np.log1p((total_documents - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+        # Per non-zero entry: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        row_of_entry = np.repeat(np.arange(total_documents), np.diff(term_frequencies.indptr))
+        length_norm = 1 - self.b + self.b * document_lengths[row_of_entry] / (average_length or 1.0)
+        tf = term_frequencies.data
+        data = idf[term_frequencies.indices] * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        weights = term_frequencies.copy()
+        weights.data = data.astype(np.float32)
+        return weights
+
+    def _query_matrix(self, queries: Sequence[str]) -> sparse.csr_matrix:
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[int] = []
+
+        for query in queries:
+            term_counts: Dict[int, int] = {}
+            for token in tokenize(query):
+                term_id = self.vocabulary.get(token)
+                if term_id is not None:
+                    term_counts[term_id] = term_counts.get(term_id, 0) + 1
+
+            indices.extend(term_counts.keys())
+            counts.extend(term_counts.values())
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (np.asarray(counts, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(queries), len(self.vocabulary))
+        )
+
+    def search_many(self, queries: Sequence[str], total_result: int) -> List[List[Dict]]:
+        """
+        Score every query against the whole index in one matrix multiply.
+
+        Returns:
+            list: For each query, its hits in the same shape as Elasticsearch hits
+            (`_score` and `_source`), best first.
+        """
+        if not self.is_loaded:
+            raise RuntimeError("Symptom matrix has not been loaded")
+
+        if not queries:
+            return []
+
+        scores = (self._query_matrix(queries) @ self.weights.T).toarray()
+        results: List[List[Dict]] = []
+
+        for row in scores:
+            matching = np.flatnonzero(row > 0)
+            if len(matching) > total_result:
+                top = np.argpartition(row[matching], -total_result)[-total_result:]
+                matching = matching[top]
+
+            ranked = matching[np.argsort(-row[matching], kind="stable")]
+            results.append([
+                {"_score": float(row[document_id]), "_source": self.sources[document_id]}
+                for document_id in ranked
+            ])
+
+        return results
+
+    def search(self, query: str, total_result: int) -> List[Dict]:
+        return self.search_many([query], total_result)[0]
+
+symptom_matrix_retriever = SymptomMatrixRetriever()
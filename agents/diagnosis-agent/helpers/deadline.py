@@ -0,0 +1,38 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised by Deadline.run when the awaited stage did not finish in time"""
+
+class Deadline:
+    """
+    A time budget shared by every stage of one request.
+
+    Args:
+        seconds (float): The budget, counted from construction.
+    """
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    async def run(self, awaitable: Awaitable[T], cap: float | None = None) -> T:
+        """
+        Await awaitable within the remaining budget, or within cap when that
+        is shorter. On timeout the awaitable is cancelled, which also closes
+        any Gemini stream it has open.
+        """
+        timeout = self.remaining() if cap is None else min(cap, self.remaining())
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded(f"Stage did not finish within {timeout:.1f}s") from e
@@ -3,6 +3,44 @@ from dotenv import load_dotenv
 
 ENVS = ["GEMINI_API_KEY", "ELASTIC_HOST", "MEDICAL_INDEX", "SEED_SECRET", "AGENT_ADRESS", "RECOMMENDATION_AGENT_ADDRESS"]
 
+OPTIONAL_ENVS = {
+    "LLM_MAX_CONCURRENCY": "8",
+    "DIAGNOSIS_SINGLE_CALL": "true",
+    "LLM_CACHE_MAX_ENTRIES": "1024",
+    "LLM_CACHE_TTL_SECONDS": "86400",
+    "LLM_CACHE_PATH": "",
+    "LLM_CACHE_MAX_DISK_ENTRIES": "100000",
+    "RETRIEVAL_CACHE_MAX_ENTRIES": "2048",
+    "RETRIEVAL_CACHE_TTL_SECONDS": "0",
+    "RETRIEVER_BACKEND": "elasticsearch",
+    "INDEX_CHUNK_SIZE": "500",
+    "INDEX_BULK_CONCURRENCY": "1",
+    "MEDICAL_SNAPSHOT_PATH": "./data/medical_dataset.arrow",
+    "INDEX_KEEP_VERSIONS": "1",
+    "ES_CONNECTIONS_PER_NODE": "10",
+    "ES_REQUEST_TIMEOUT": "30",
+    "ES_MAX_RETRIES": "3",
+    "DIAGNOSIS_BATCH_MAX_SIZE": "50",
+    "DIAGNOSIS_BATCH_CONCURRENCY": "4",
+    "STREAM_PORT": "8011",
+    "DIAGNOSIS_DEADLINE_SECONDS": "30",
+    "RECOMMENDATION_TIMEOUT_SECONDS": "60",
+    "RESILIENCE_MAX_ATTEMPTS": "3",
+    "RESILIENCE_BASE_DELAY": "0.2",
+    "RESILIENCE_MAX_DELAY": "5",
+    "RESILIENCE_FAILURE_THRESHOLD": "5",
+    "RESILIENCE_RECOVERY_SECONDS": "30",
+    "RESILIENCE_RETRY_BUDGET_RATIO": "0.2",
+    "GEMINI_RATE_PER_MINUTE": "30",
+    "GEMINI_BURST": "5",
+    "GEMINI_NORMAL_MAX_WAIT": "10",
+    "GEMINI_LOW_MAX_WAIT": "2",
+    "GEMINI_THROTTLE_SECONDS": "10",
+    "LOG_QUEUE_SIZE": "10000",
+    "LOG_PAYLOAD_MAX_CHARS": "500",
+    "LOG_PAYLOAD_SAMPLE_RATE": "0.1",
+}
+
 class EnvHelper:
     """Class for gathering and saving all env for the application """
     def __init__(self):
@@ -32,4 +70,64 @@ class EnvHelper:
         self.AGENT_ADRESS = self.envs[ENVS[4]]
         self.RECOMMENDATION_AGENT_ADDRESS = self.envs[ENVS[5]]
 
+        self.LLM_MAX_CONCURRENCY = self.get_int("LLM_MAX_CONCURRENCY")
+        self.DIAGNOSIS_SINGLE_CALL = self.get_bool("DIAGNOSIS_SINGLE_CALL")
+        self.LLM_CACHE_MAX_ENTRIES = self.get_int("LLM_CACHE_MAX_ENTRIES")
+        self.LLM_CACHE_TTL_SECONDS = self.get_float("LLM_CACHE_TTL_SECONDS")
+        self.LLM_CACHE_PATH = self.get_optional("LLM_CACHE_PATH")
+        self.LLM_CACHE_MAX_DISK_ENTRIES = self.get_int("LLM_CACHE_MAX_DISK_ENTRIES")
+        self.RETRIEVAL_CACHE_MAX_ENTRIES = self.get_int("RETRIEVAL_CACHE_MAX_ENTRIES")
+        self.RETRIEVAL_CACHE_TTL_SECONDS = self.get_float("RETRIEVAL_CACHE_TTL_SECONDS")
+        self.RETRIEVER_BACKEND = self.get_optional("RETRIEVER_BACKEND").strip().lower()
+        self.INDEX_CHUNK_SIZE = self.get_int("INDEX_CHUNK_SIZE")
+        self.INDEX_BULK_CONCURRENCY = self.get_int("INDEX_BULK_CONCURRENCY")
+        # Set but empty disables the snapshot, so only an unset variable falls back to the default
+        self.MEDICAL_SNAPSHOT_PATH = os.getenv("MEDICAL_SNAPSHOT_PATH", OPTIONAL_ENVS["MEDICAL_SNAPSHOT_PATH"])
+        self.INDEX_KEEP_VERSIONS = self.get_int("INDEX_KEEP_VERSIONS")
+        self.ES_CONNECTIONS_PER_NODE = self.get_int("ES_CONNECTIONS_PER_NODE")
+        self.ES_REQUEST_TIMEOUT = self.get_float("ES_REQUEST_TIMEOUT")
+        self.ES_MAX_RETRIES = self.get_int("ES_MAX_RETRIES")
+        self.DIAGNOSIS_BATCH_MAX_SIZE = self.get_int("DIAGNOSIS_BATCH_MAX_SIZE")
+        self.DIAGNOSIS_BATCH_CONCURRENCY = self.get_int("DIAGNOSIS_BATCH_CONCURRENCY")
+        self.STREAM_PORT = self.get_int("STREAM_PORT")
+        self.DIAGNOSIS_DEADLINE_SECONDS = self.get_float("DIAGNOSIS_DEADLINE_SECONDS")
+        self.RECOMMENDATION_TIMEOUT_SECONDS = self.get_float("RECOMMENDATION_TIMEOUT_SECONDS")
+        self.RESILIENCE_MAX_ATTEMPTS = self.get_int("RESILIENCE_MAX_ATTEMPTS")
+        self.RESILIENCE_BASE_DELAY = self.get_float("RESILIENCE_BASE_DELAY")
+        self.RESILIENCE_MAX_DELAY = self.get_float("RESILIENCE_MAX_DELAY")
+        self.RESILIENCE_FAILURE_THRESHOLD = self.get_int("RESILIENCE_FAILURE_THRESHOLD")
+        self.RESILIENCE_RECOVERY_SECONDS = self.get_float("RESILIENCE_RECOVERY_SECONDS")
+        self.RESILIENCE_RETRY_BUDGET_RATIO = self.get_float("RESILIENCE_RETRY_BUDGET_RATIO")
+        self.GEMINI_RATE_PER_MINUTE = self.get_float("GEMINI_RATE_PER_MINUTE")
+        self.GEMINI_BURST = self.get_int("GEMINI_BURST")
+        self.GEMINI_NORMAL_MAX_WAIT = self.get_float("GEMINI_NORMAL_MAX_WAIT")
+        self.GEMINI_LOW_MAX_WAIT = self.get_float("GEMINI_LOW_MAX_WAIT")
+        self.GEMINI_THROTTLE_SECONDS = self.get_float("GEMINI_THROTTLE_SECONDS")
+        self.LOG_QUEUE_SIZE = self.get_int("LOG_QUEUE_SIZE")
+        self.LOG_PAYLOAD_MAX_CHARS = self.get_int("LOG_PAYLOAD_MAX_CHARS")
+        self.LOG_PAYLOAD_SAMPLE_RATE = self.get_float("LOG_PAYLOAD_SAMPLE_RATE")
+
+    def get_optional(self, env: str) -> str:
+        """Get an optional env, falling back to its default in OPTIONAL_ENVS when it is not set or empty"""
+        env_value = os.getenv(env)
+        if env_value is None or env_value == "":
+            return OPTIONAL_ENVS[env]
+
+        return env_value
+
+    def get_int(self, env: str) -> int:
+        try:
+            return int(self.get_optional(env))
+        except ValueError:
+            return int(OPTIONAL_ENVS[env])
+
+    def get_float(self, env: str) -> float:
+        try:
+            return float(self.get_optional(env))
+        except ValueError:
+            return float(OPTIONAL_ENVS[env])
+
+    def get_bool(self, env: str) -> bool:
+        return self.get_optional(env).strip().lower() in ("1", "true", "yes", "on")
+
 env_helper = EnvHelper()
\ No newline at end of file
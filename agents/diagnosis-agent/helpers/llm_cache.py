@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+from helpers.lru_cache import LRUCache
+
+class LLMCache:
+    """
+    Two tier cache for LLM answers keyed by a hash of the model and the prompt.
+
+    The first tier is an in-memory LRU. When a disk path is given, answers are
+    also written to a SQLite database so they survive restarts. Both tiers
+    expire entries after ttl_seconds and evict the least recently used entries
+    once they grow past their size limit.
+
+    Coroutines use get_async and set_async, which run the disk tier on a
+    single background thread so SQLite never blocks the event loop. Reads
+    only remember when an entry was used, the access times are written
+    with the next insert.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float, disk_path: str = "", max_disk_entries: int = 0):
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.max_disk_entries = max_disk_entries
+
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._touched: Dict[str, float] = {}
+        self._disk_executor: ThreadPoolExecutor | None = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, disk_path: str):
+        directory = os.path.dirname(disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(disk_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at)")
+        self._connection.commit()
+        self._disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache-disk")
+
+    @staticmethod
+    def make_key(model: str, prompt: str, variant: str = "") -> str:
+        """
+        Hash the model, the prompt and anything else that changes the answer
+        (e.g. the response schema) into a cache key.
+        """
+        digest = hashlib.sha256()
+        for part in (model, variant, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        value = self._get_from_disk(key)
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.set(key, value)
+            return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        self._set_to_disk(key, value)
+
+    async def get_async(self, key: str) -> str | None:
+        """get without blocking the event loop on the disk tier"""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self._disk_executor is not None:
+            value = await asyncio.get_running_loop().run_in_executor(self._disk_executor, self._get_from_disk, key)
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.set(key, value)
+            return value
+
+        self.misses += 1
+        return None
+
+    def set_async(self, key: str, value: str):
+        """set that returns right away, the disk write happens on the background thread"""
+        self.memory.set(key, value)
+        if self._disk_executor is not None:
+            self._disk_executor.submit(self._set_to_disk, key, value)
+
+    def _get_from_disk(self, key: str) -> str | None:
+        if self._connection is None:
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                # Purged by the next insert
+                return None
+
+            self._touched[key] = now
+
+        return value
+
+    def _set_to_disk(self, key: str, value: str):
+        if self._connection is None:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            if self._touched:
+                self._connection.executemany(
+                    "UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+                    [(accessed_at, touched_key) for touched_key, accessed_at in self._touched.items()]
+                )
+                self._touched.clear()
+
+            if self.ttl_seconds > 0:
+                self._connection.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+
+            if self.max_disk_entries > 0:
+                self._connection.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+
+            self._connection.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory.hits + self.disk_hits + self.misses
+        hits = self.memory.hits + self.disk_hits
+        return {
+            "memory": self.memory.stats(),
+            "disk_enabled": self._connection is not None,
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,135 @@
+import atexit
+import logging
+import queue
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Iterable, Iterator
+from helpers import env_helper
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+payload_sampled_var: ContextVar[bool] = ContextVar("payload_sampled", default=False)
+
+LOG_FORMAT = "%(asctime)s | %(levelname)-8s | %(request_id)s | %(name)s | %(message)s"
+
+# Loggers of this agent's own modules, the only ones logging at DEBUG
+APP_LOGGERS = ("__main__", "main", "llm", "stream_server", "processes", "database", "helpers")
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the request id of the context that logged them"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_queue_handler: DroppingQueueHandler | None = None
+_listener: QueueListener | None = None
+
+def setup_logging(log_file: str = "app.log", loggers: Iterable[logging.Logger] = ()) -> logging.Logger:
+    """
+    Send every log record through a bounded queue to a background thread
+    that writes to stdout (INFO and up) and to log_file (everything), so
+    logging never does I/O on the event loop. Only APP_LOGGERS and the
+    loggers given log at DEBUG, libraries stay at INFO so their chatter
+    cannot fill the queue. Calling it again does not add handlers; it only
+    reroutes the loggers given, e.g. the uagents agent logger that does not
+    propagate to the root logger.
+    """
+    global _queue_handler, _listener
+    logger = logging.getLogger()
+
+    if _queue_handler is None:
+        formatter = logging.Formatter(fmt=LOG_FORMAT, datefmt="%Y-%m-%d %H:%M:%S", defaults={"request_id": "-"})
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(formatter)
+
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=env_helper.LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(RequestIdFilter())
+        _listener = QueueListener(_queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        logger.setLevel(logging.INFO)
+        for name in APP_LOGGERS:
+            logging.getLogger(name).setLevel(logging.DEBUG)
+        loggers = [logger, *loggers]
+
+    # Replaces the handlers already there, e.g. the stderr handler uagents installs on import
+    for routed in loggers:
+        if routed is not logger:
+            routed.setLevel(logging.DEBUG)
+        if _queue_handler not in routed.handlers:
+            for handler in list(routed.handlers):
+                routed.removeHandler(handler)
+            routed.addHandler(_queue_handler)
+
+    return logger
+
+def dropped_records() -> int:
+    """Records dropped because the log queue was full"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+@contextmanager
+def request_context(request_id: str | None = None) -> Iterator[str]:
+    """
+    Tag every record logged inside the block, and in tasks it starts, with
+    request_id (a new one when none is given). The block is sampled for
+    payload logging with LOG_PAYLOAD_SAMPLE_RATE.
+    """
+    request_id = request_id or uuid.uuid4().hex[:12]
+    previous = request_id_var.get(), payload_sampled_var.get()
+    request_id_var.set(request_id)
+    payload_sampled_var.set(random.random() < env_helper.LOG_PAYLOAD_SAMPLE_RATE)
+    try:
+        yield request_id
+    finally:
+        # Set back rather than reset: a streaming generator may be closed from another context
+        request_id_var.set(previous[0])
+        payload_sampled_var.set(previous[1])
+
+def truncate(value: Any, limit: int | None = None) -> str:
+    text = str(value)
+    limit = env_helper.LOG_PAYLOAD_MAX_CHARS if limit is None else limit
+    if len(text) <= limit:
+        return text
+
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+class payload:
+    """
+    Log argument for a prompt, an LLM answer or a search response. Rendered
+    when the record is queued: truncated to LOG_PAYLOAD_MAX_CHARS in sampled
+    requests, reduced to its size or type otherwise, without rendering it.
+    """
+    __slots__ = ("value", "sampled")
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.sampled = payload_sampled_var.get()
+
+    def __str__(self) -> str:
+        if self.sampled:
+            return truncate(self.value)
+        if isinstance(self.value, (str, bytes)):
+            return f"<{len(self.value)} chars, not sampled>"
+        return f"<{type(self.value).__name__}, not sampled>"
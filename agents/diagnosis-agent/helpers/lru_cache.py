@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+class LRUCache:
+    """
+    Thread safe in-memory LRU cache with an optional time to live.
+
+    Args:
+        max_entries (int): How many entries to keep before evicting the least recently used one.
+        ttl_seconds (float): How long an entry stays valid. 0 or less keeps entries until evicted.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float = 0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and self.clock() - stored_at > self.ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry[0]):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, predicate: Callable[[Hashable], bool] | None = None):
+        """Remove every entry, or only the entries whose key matches predicate"""
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+                return
+
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
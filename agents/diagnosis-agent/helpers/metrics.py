@@ -0,0 +1,201 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+logging = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames: Sequence[str], values: LabelValues, extra: Dict[str, str] | None = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in (extra or {}).items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Copy a running total kept elsewhere, e.g. in a stats() dict"""
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in self.values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: the count of every bucket (plus +Inf), the sum and the count
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, totals = self.values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0, 0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, (total, count)) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {_format_value(count)}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Process wide metrics in the Prometheus text format.
+
+    Metrics are created on first use and shared by name afterwards.
+    Collectors are called right before rendering, to copy values that live
+    elsewhere (cache stats, scheduler state) into gauges, or into counters
+    with set_total when they only ever grow.
+    """
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, description, labelnames)
+
+    def gauge(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, description, labelnames)
+
+    def histogram(self, name: str, description: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, labelnames, buckets)
+
+    def add_collector(self, collector: Callable[[], None]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception:
+                logging.exception(f"Metrics collector {collector} failed")
+
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram("stage_duration_seconds", "Latency of each pipeline stage", ["stage"])
+STAGE_ERRORS = registry.counter("stage_errors_total", "Pipeline stages that raised, by exception type", ["stage", "error"])
+STAGE_IN_FLIGHT = registry.gauge("stage_in_flight", "Pipeline stages currently running", ["stage"])
+
+@asynccontextmanager
+async def track_stage(stage: str):
+    """Record the latency, in-flight count and errors of the wrapped block as stage"""
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        error = "Cancelled" if isinstance(e, asyncio.CancelledError) else type(e).__name__
+        STAGE_ERRORS.inc(stage=stage, error=error)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, stage=stage)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+async def timed(stage: str, awaitable):
+    """Await awaitable inside track_stage(stage)"""
+    async with track_stage(stage):
+        return await awaitable
+
+CACHE_HIT_RATIO = registry.gauge("cache_hit_ratio", "Share of cache lookups answered from the cache", ["cache"])
+CACHE_LOOKUPS = registry.counter("cache_lookups_total", "Cache lookups since start, by result", ["cache", "result"])
+CACHE_ENTRIES = registry.gauge("cache_entries", "Entries held in memory by the cache", ["cache"])
+
+def register_cache(name: str, stats: Callable[[], Dict]):
+    """
+    Export a cache through its stats() dict: hit_ratio, and hits, misses
+    and entries when present (LRUCache), or memory_hits and disk_hits
+    (LLMCache).
+    """
+    def collect():
+        values = stats()
+        CACHE_HIT_RATIO.set(values.get("hit_ratio", 0.0), cache=name)
+        hits = values.get("hits", values.get("memory_hits", 0) + values.get("disk_hits", 0))
+        CACHE_LOOKUPS.set_total(hits, cache=name, result="hit")
+        CACHE_LOOKUPS.set_total(values.get("misses", 0), cache=name, result="miss")
+        entries = values.get("entries", values.get("memory", {}).get("entries"))
+        if entries is not None:
+            CACHE_ENTRIES.set(entries, cache=name)
+
+    registry.add_collector(collect)
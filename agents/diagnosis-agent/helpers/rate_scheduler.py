@@ -0,0 +1,156 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Tuple
+
+class Priority(IntEnum):
+    """Lower values are served first"""
+    CRITICAL = 0
+    NORMAL = 1
+    LOW = 2
+
+class RateLimitShed(Exception):
+    """Raised by PriorityRateScheduler.acquire when a call is dropped to save quota for more important ones"""
+    def __init__(self, priority: Priority, waited: float):
+        super().__init__(f"{priority.name.lower()} priority call shed after waiting {waited:.1f}s for quota")
+        self.priority = priority
+
+class PriorityRateScheduler:
+    """
+    Token bucket in front of a rate limited API, with a priority queue.
+
+    rate_per_minute tokens refill continuously, up to burst. A call takes one
+    token, or waits in the queue, where higher priority calls are always
+    served first. A call that would wait longer than the max_wait of its
+    priority is shed with RateLimitShed, so under pressure low priority work
+    is dropped before anything important is delayed. A 429 from the API can
+    be reported with throttle() to pause the bucket.
+
+    Args:
+        rate_per_minute (float): Sustained calls per minute. 0 or less disables the limit.
+        burst (int): How many calls can start at once after an idle period.
+        max_wait (dict): Longest queueing time per priority, in seconds. Missing priorities wait as long as needed.
+    """
+    def __init__(self, rate_per_minute: float, burst: int, max_wait: Dict[Priority, float], clock: Callable[[], float] = time.monotonic):
+        self.rate_per_second = rate_per_minute / 60
+        self.burst = max(1, burst)
+        self.max_wait = max_wait
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated_at = clock()
+        self.paused_until = 0.0
+
+        self._queue: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+        self._granted_at = deque()
+
+        self.granted = {priority.name.lower(): 0 for priority in Priority}
+        self.shed = {priority.name.lower(): 0 for priority in Priority}
+        self.throttled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_second > 0
+
+    def _refill(self):
+        now = self.clock()
+        if now > self.paused_until:
+            start = max(self.updated_at, self.paused_until)
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate_per_second)
+        self.updated_at = now
+
+    def _grant(self, priority: Priority):
+        self.tokens -= 1
+        self.granted[priority.name.lower()] += 1
+        self._granted_at.append(self.clock())
+
+    def _shed(self, priority: Priority, waited: float) -> RateLimitShed:
+        self.shed[priority.name.lower()] += 1
+        return RateLimitShed(priority, waited)
+
+    def estimated_wait(self, priority: Priority) -> float:
+        """Seconds until a call of priority queued now would get a token"""
+        self._refill()
+        ahead = sum(1 for entry in self._queue if entry[0] <= priority and not entry[3].done())
+        needed = ahead + 1 - self.tokens
+        wait = needed / self.rate_per_second if needed > 0 else 0.0
+        return wait + max(0.0, self.paused_until - self.clock())
+
+    async def acquire(self, priority: Priority = Priority.NORMAL):
+        """Wait for a token. Raises RateLimitShed when the call is not worth the wait"""
+        if not self.enabled:
+            return
+
+        self._refill()
+        if not self._queue and self.tokens >= 1 and self.clock() >= self.paused_until:
+            self._grant(priority)
+            return
+
+        max_wait = self.max_wait.get(priority)
+        if max_wait is not None and self.estimated_wait(priority) > max_wait:
+            raise self._shed(priority, 0.0)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), self.clock(), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        await future
+
+    async def _dispatch(self):
+        while self._queue:
+            self._refill()
+            while self._queue and self.tokens >= 1 and self.clock() >= self.paused_until:
+                priority, _, queued_at, future = heapq.heappop(self._queue)
+                if future.done():
+                    # Cancelled while waiting, e.g. by the request deadline
+                    continue
+
+                waited = self.clock() - queued_at
+                max_wait = self.max_wait.get(priority)
+                if max_wait is not None and waited > max_wait:
+                    future.set_exception(self._shed(priority, waited))
+                    continue
+
+                self._grant(priority)
+                future.set_result(None)
+
+            if self._queue:
+                next_token = max(0.0, 1 - self.tokens) / self.rate_per_second
+                await asyncio.sleep(max(next_token, self.paused_until - self.clock(), 0.01))
+
+    def throttle(self, seconds: float):
+        """The API answered 429: hand out no tokens for seconds and start refilling from empty"""
+        self.throttled += 1
+        self._refill()
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        while self._granted_at and now - self._granted_at[0] > 60:
+            self._granted_at.popleft()
+
+        self._refill()
+        rate_per_minute = self.rate_per_second * 60
+        queued = {priority.name.lower(): 0 for priority in Priority}
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                queued[Priority(priority).name.lower()] += 1
+
+        return {
+            "rate_per_minute": rate_per_minute,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "granted_last_minute": len(self._granted_at),
+            "utilization": round(len(self._granted_at) / rate_per_minute, 3) if rate_per_minute > 0 else 0.0,
+            "paused_for_seconds": round(max(0.0, self.paused_until - now), 2),
+            "throttled": self.throttled,
+            "queued": queued,
+            "granted": dict(self.granted),
+            "shed": dict(self.shed),
+        }
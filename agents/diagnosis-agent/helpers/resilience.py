@@ -0,0 +1,265 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised without calling the endpoint while its circuit breaker is open"""
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"{endpoint} is unavailable, retry in {retry_after:.1f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether error looks transient: a timeout, a connection failure, or an
+    HTTP 408, 429 or 5xx. Works with the exceptions of requests, httpx,
+    aiohttp, openai and google-genai without importing them.
+    """
+    status = None
+    for attribute in ("status_code", "code", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            status = value
+            break
+    response = getattr(error, "response", None)
+    if status is None and isinstance(getattr(response, "status_code", None), int):
+        status = response.status_code
+
+    if status is not None:
+        return status in (408, 429) or status >= 500
+
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connect" in name
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails fast for
+    recovery_timeout seconds, then lets a single trial call through
+    (half open). The trial closes the breaker again or reopens it.
+    """
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def before_call(self, endpoint: str):
+        with self._lock:
+            if self.state == OPEN:
+                waited = self.clock() - self.opened_at
+                if waited < self.recovery_timeout:
+                    raise CircuitOpenError(endpoint, self.recovery_timeout - waited)
+                self.state = HALF_OPEN
+
+            if self.state == HALF_OPEN:
+                if self.trial_in_flight:
+                    raise CircuitOpenError(endpoint, 0.0)
+                self.trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+    def release(self):
+        """Give up a half open trial that was cancelled before it finished"""
+        with self._lock:
+            self.trial_in_flight = False
+
+class RetryBudget:
+    """
+    Limits retries to a fraction of the traffic. Every call deposits ratio
+    tokens, a retry spends one, and min_per_second tokens trickle in so low
+    traffic can still retry. During an outage the budget runs dry and calls
+    fail after their first attempt instead of multiplying the load.
+    """
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.clock = clock
+        self.tokens = max_tokens
+        self.updated_at = clock()
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.exhausted += 1
+            return False
+
+class ResilientEndpoint:
+    """
+    One remote API guarded by a circuit breaker, with retries using full
+    jitter exponential backoff that are limited by a retry budget.
+
+    Args:
+        name (str): The endpoint name used in errors and in resilience_state().
+        max_attempts (int): Attempts per call, the first one included.
+        base_delay (float): Backoff before the first retry, doubled for every further one.
+        max_delay (float): Upper bound of a single backoff.
+    """
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 5.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        retry_budget_ratio: float = 0.2,
+        retryable: Callable[[Exception], bool] = is_retryable,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout, clock)
+        self.budget = RetryBudget(ratio=retry_budget_ratio, clock=clock)
+
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _start_attempt(self):
+        try:
+            self.breaker.before_call(self.name)
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        """Record a failed attempt and decide whether to try again"""
+        if not self.retryable(error):
+            # The API answered, so it is up, the request itself was wrong
+            self.breaker.record_success()
+            return False
+
+        self.failures += 1
+        self.breaker.record_failure()
+        if attempt + 1 >= self.max_attempts or self.breaker.state == OPEN:
+            return False
+        if not self.budget.try_spend():
+            return False
+
+        self.retries += 1
+        return True
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Await func(), retrying transient failures. Raises CircuitOpenError when the breaker is open"""
+        self.calls += 1
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            self._start_attempt()
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def call_sync(self, func: Callable[[], T]) -> T:
+        """Blocking version of call"""
+        self.calls += 1
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            self._start_attempt()
+            try:
+                result = func()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def report_failure(self, error: Exception):
+        """
+        Count a failure that happened after call() returned, e.g. while reading
+        a stream it opened, so a stream that keeps breaking off opens the breaker
+        """
+        if self.retryable(error):
+            self.failures += 1
+            self.breaker.record_failure()
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "retry_budget_exhausted": self.budget.exhausted,
+        }
+
+_endpoints: Dict[str, ResilientEndpoint] = {}
+
+def get_endpoint(name: str, **settings) -> ResilientEndpoint:
+    """The process wide endpoint called name, created with settings on first use"""
+    if name not in _endpoints:
+        _endpoints[name] = ResilientEndpoint(name, **settings)
+    return _endpoints[name]
+
+def resilience_state() -> Dict[str, Dict[str, Any]]:
+    """Breaker, retry and budget state of every endpoint, for monitoring"""
+    return {name: endpoint.state() for name, endpoint in _endpoints.items()}
@@ -1,16 +1,74 @@
-﻿from google import genai
+﻿import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable
+from google import genai
 from google.genai import types
 from helpers import env_helper
+from helpers.llm_cache import LLMCache
+from helpers.metrics import registry, register_cache, track_stage
+from helpers.resilience import get_endpoint, is_retryable
+from helpers.rate_scheduler import Priority, PriorityRateScheduler
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429
 
 class GeminiLLM:
     def __init__(self):
         super().__init__()
         self.API_KEY = env_helper.GEMINI_API_KEY
+        self.MODEL = "gemini-2.0-flash-lite"
         self.client = genai.Client(api_key=self.API_KEY)
+        self.max_concurrency = env_helper.LLM_MAX_CONCURRENCY
+        self._semaphore: asyncio.Semaphore | None = None
+        self.cache = LLMCache(
+            max_entries=env_helper.LLM_CACHE_MAX_ENTRIES,
+            ttl_seconds=env_helper.LLM_CACHE_TTL_SECONDS,
+            disk_path=env_helper.LLM_CACHE_PATH,
+            max_disk_entries=env_helper.LLM_CACHE_MAX_DISK_ENTRIES,
+        )
+        # Retries and a circuit breaker shared by every Gemini call of this process.
+        # A 429 is not retried there but queued again behind the scheduler
+        self.endpoint = get_endpoint(
+            "gemini",
+            max_attempts=env_helper.RESILIENCE_MAX_ATTEMPTS,
+            base_delay=env_helper.RESILIENCE_BASE_DELAY,
+            max_delay=env_helper.RESILIENCE_MAX_DELAY,
+            failure_threshold=env_helper.RESILIENCE_FAILURE_THRESHOLD,
+            recovery_timeout=env_helper.RESILIENCE_RECOVERY_SECONDS,
+            retry_budget_ratio=env_helper.RESILIENCE_RETRY_BUDGET_RATIO,
+            retryable=lambda error: not is_rate_limited(error) and is_retryable(error),
+        )
+        # Shares the Gemini quota between call sites, critical ones first
+        self.scheduler = PriorityRateScheduler(
+            rate_per_minute=env_helper.GEMINI_RATE_PER_MINUTE,
+            burst=env_helper.GEMINI_BURST,
+            max_wait={
+                Priority.NORMAL: env_helper.GEMINI_NORMAL_MAX_WAIT,
+                Priority.LOW: env_helper.GEMINI_LOW_MAX_WAIT,
+            },
+        )
+        self.quota_wait = registry.histogram("llm_quota_wait_seconds", "Time Gemini calls waited for rate limit quota", ["priority"])
+        register_cache("llm", self.cache.stats)
+        registry.add_collector(self._collect_metrics)
 
-    def answer(self, prompt: str):
-        model = "gemini-2.0-flash-lite"
-        contents = [
+    def _collect_metrics(self):
+        stats = self.scheduler.stats()
+        registry.gauge("llm_rate_utilization", "Share of the Gemini per minute quota used in the last minute").set(stats["utilization"])
+        registry.gauge("llm_rate_tokens", "Gemini calls that can start right now without waiting").set(stats["tokens"])
+        queued = registry.gauge("llm_queued_calls", "Gemini calls waiting for quota", ["priority"])
+        shed = registry.counter("llm_shed_calls_total", "Gemini calls shed to save quota since start", ["priority"])
+        for priority in Priority:
+            name = priority.name.lower()
+            queued.set(stats["queued"][name], priority=name)
+            shed.set_total(stats["shed"][name], priority=name)
+
+        state = self.endpoint.state()
+        registry.gauge("llm_circuit_open", "1 while the Gemini circuit breaker rejects calls").set(int(state["state"] != "closed"))
+        registry.counter("llm_retries_total", "Gemini attempts retried since start").set_total(state["retries"])
+
+    def _build_contents(self, prompt: str):
+        return [
             types.Content(
                 role="user",
                 parts=[
@@ -19,21 +77,146 @@ class GeminiLLM:
             ),
         ]
 
-        generate_content_config = types.GenerateContentConfig(
+    def _build_config(self, response_schema: types.Schema | None = None):
+        if response_schema is not None:
+            return types.GenerateContentConfig(
+                temperature=0,
+                response_mime_type="application/json",
+                response_schema=response_schema,
+            )
+
+        return types.GenerateContentConfig(
             temperature=0,
             response_mime_type="text/plain",
         )
 
-        result = ""
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Caps how many Gemini requests this process has in flight at once"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        return self._semaphore
+
+    async def _call(self, func: Callable[[], Awaitable[Any]], priority: Priority) -> Any:
+        """
+        Run one Gemini request: wait for quota at priority, then call it with
+        retries and the circuit breaker. A 429 pauses the scheduler so queued
+        calls stop hitting the limit, and the request waits for a new token
+        behind that pause, up to RESILIENCE_MAX_ATTEMPTS times.
+        """
+        for attempt in range(self.endpoint.max_attempts):
+            waiting_since = time.perf_counter()
+            await self.scheduler.acquire(priority)
+            self.quota_wait.observe(time.perf_counter() - waiting_since, priority=priority.name.lower())
+
+            try:
+                async with self.semaphore, track_stage("gemini"):
+                    return await self.endpoint.call(func)
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+                self.scheduler.throttle(env_helper.GEMINI_THROTTLE_SECONDS)
+                if attempt + 1 >= self.endpoint.max_attempts:
+                    raise
+
+    def _cache_key(self, prompt: str, response_schema: types.Schema | None = None) -> str:
+        # Answers are deterministic (temperature 0), so the model, the prompt
+        # and the response schema fully determine them.
+        variant = response_schema.model_dump_json(exclude_none=True) if response_schema is not None else ""
+        return LLMCache.make_key(self.MODEL, prompt, variant)
+
+    def answer(self, prompt: str):
+        cache_key = self._cache_key(prompt)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        for chunk in self.client.models.generate_content_stream(
-                model=model,
-                contents=contents,
-                config=generate_content_config,
-        ):
-            result += chunk.text
-            # print(chunk.text, end="")
+        def generate() -> str:
+            result = ""
+            for chunk in self.client.models.generate_content_stream(
+                    model=self.MODEL,
+                    contents=self._build_contents(prompt),
+                    config=self._build_config(),
+            ):
+                result += chunk.text
+                # print(chunk.text, end="")
+            return result
+
+        result = self.endpoint.call_sync(generate)
+
+        if result:
+            self.cache.set(cache_key, result)
+
+        return result
+
+    async def answer_async(self, prompt: str, response_schema: types.Schema | None = None, priority: Priority = Priority.NORMAL) -> str:
+        """
+        Same as answer, but awaits Gemini instead of blocking the event loop.
+        priority decides the call's place in the quota queue, LOW calls are
+        shed first when quota runs short.
+        """
+        cache_key = self._cache_key(prompt, response_schema)
+        cached = await self.cache.get_async(cache_key)
+        if cached is not None:
+            return cached
+
+        async def generate() -> str:
+            result = ""
+            async for chunk in await self.client.aio.models.generate_content_stream(
+                    model=self.MODEL,
+                    contents=self._build_contents(prompt),
+                    config=self._build_config(response_schema),
+            ):
+                result += chunk.text or ""
+            return result
+
+        result = await self._call(generate, priority)
+
+        if result:
+            self.cache.set_async(cache_key, result)
 
         return result
 
+    async def stream_async(self, prompt: str, priority: Priority = Priority.NORMAL) -> AsyncIterator[str]:
+        """
+        Yield the text of answer_async chunk by chunk as Gemini produces it.
+        A cached answer is yielded as a single chunk, and the full text is
+        cached once the stream completes.
+        """
+        cache_key = self._cache_key(prompt)
+        cached = await self.cache.get_async(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        result = ""
+
+        # Only opening the stream is retried, tokens already yielded cannot be taken back
+        stream = await self._call(lambda: self.client.aio.models.generate_content_stream(
+            model=self.MODEL,
+            contents=self._build_contents(prompt),
+            config=self._build_config(),
+        ), priority)
+        try:
+            async for chunk in stream:
+                if chunk.text:
+                    result += chunk.text
+                    yield chunk.text
+        except Exception as e:
+            # The breaker recorded a success once the stream opened
+            self.endpoint.report_failure(e)
+            raise
+
+        if result:
+            self.cache.set_async(cache_key, result)
+
+    async def answer_json_async(self, prompt: str, response_schema: types.Schema, priority: Priority = Priority.NORMAL) -> dict:
+        """
+        Ask Gemini for a single JSON object constrained to response_schema,
+        using the SDK's JSON response mode so no markdown cleanup is needed.
+        """
+        result = await self.answer_async(prompt, response_schema=response_schema, priority=priority)
+        return json.loads(result)
+
 gemini_llm = GeminiLLM()
\ No newline at end of file
@@ -1,12 +1,14 @@
-﻿import logging
-import sys
-import traceback
-import asyncio
+﻿import asyncio
 from uagents import Agent, Context
-from database import build_all_index
-from models import DiagnosisResponse, DiagnosisFromSymptomsRequest, DiagonsisRawRequest, StringResponse, RecommendationAgentResponse
+from database import build_all_index, close_es_client, es_health_stats
+from models import DiagnosisResponse, DiagnosisFromSymptomsRequest, DiagnosisBatchRequest, DiagnosisBatchResponse, EsHealthResponse, ResilienceStateResponse, SchedulerStateResponse, DiagonsisRawRequest, StringResponse, RecommendationAgentResponse
 from helpers import env_helper
-from processes.entry import get_diagnosis, get_diagnosis_raw, get_structure_from_raw_text
+from helpers.log_helper import payload, request_context, setup_logging
+from helpers.metrics import track_stage
+from helpers.resilience import resilience_state
+from stream_server import start_stream_server
+from llm import gemini_llm
+from processes.entry import get_diagnosis, get_diagnosis_batch, get_diagnosis_raw, get_structure_from_raw_text
 from models.diagnosis_raw_request import DiagonsisRawRequest
 from datetime import datetime
 from uuid import uuid4
@@ -28,45 +30,82 @@ agent = Agent(
     readme_path='./README.md'
 )
 
+stream_server_task: asyncio.Task | None = None
+
 @agent.on_event("startup")
 async def start_application(ctx: Context):
+    global stream_server_task
+    # Also moves the agent's own logger off its synchronous stdout handler
+    setup_logging(loggers=[ctx.logger])
     try:
-        setup_logging()
-        build_all_index()
+        await build_all_index()
     except Exception as e:
-        ctx.logger.error(e)
-        traceback.print_exc()
+        ctx.logger.exception(e)
+
+    if env_helper.STREAM_PORT > 0:
+        ctx.logger.info(f"Serving streaming and /metrics routes on port {env_helper.STREAM_PORT}")
+        stream_server_task = start_stream_server(ctx, env_helper.STREAM_PORT)
+
+@agent.on_event("shutdown")
+async def stop_application(ctx: Context):
+    if stream_server_task is not None:
+        stream_server_task.cancel()
+    await close_es_client()
 
 @agent.on_rest_post("/diagnosis/from-symptoms", request=DiagnosisFromSymptomsRequest, response=DiagnosisResponse)
 async def diagnosis_from_symptoms(ctx: Context, req: DiagnosisFromSymptomsRequest) -> DiagnosisResponse:
-    ctx.logger.info(f"Received REST request: {req}")
-    diagnosis = await get_diagnosis(ctx, req)
+    with request_context():
+        ctx.logger.info(f"Received REST request with {len(req.symptoms)} symptoms")
+        async with track_stage("request_from_symptoms"):
+            diagnosis = await get_diagnosis(ctx, req)
 
     return diagnosis
 
+@agent.on_rest_post("/diagnosis/batch", request=DiagnosisBatchRequest, response=DiagnosisBatchResponse)
+async def diagnosis_batch(ctx: Context, req: DiagnosisBatchRequest) -> DiagnosisBatchResponse:
+    with request_context():
+        ctx.logger.info(f"Received REST batch request with {len(req.requests)} cases")
+        async with track_stage("request_batch"):
+            results = await get_diagnosis_batch(ctx, req)
+
+    return results
+
+@agent.on_rest_get("/resilience", response=ResilienceStateResponse)
+async def resilience(ctx: Context) -> ResilienceStateResponse:
+    return ResilienceStateResponse(endpoints=resilience_state())
+
+@agent.on_rest_get("/es/health", response=EsHealthResponse)
+async def es_health(ctx: Context) -> EsHealthResponse:
+    return EsHealthResponse(stats=await es_health_stats())
+
+@agent.on_rest_get("/llm/scheduler", response=SchedulerStateResponse)
+async def llm_scheduler(ctx: Context) -> SchedulerStateResponse:
+    return SchedulerStateResponse(state=gemini_llm.scheduler.stats())
+
 @agent.on_message(model=RecommendationAgentResponse)
 async def receive_message_recommendation(ctx: Context, sender: str, data: RecommendationAgentResponse) -> DiagnosisResponse:
     ctx.logger.info(f"Got response from AI agent: {data.answer}")
 
 @agent.on_rest_post("/diagnosis/get_structure", request=DiagonsisRawRequest, response=StringResponse)
 async def diagnosis_from_symptoms(ctx: Context, req: DiagonsisRawRequest) -> StringResponse:
-    ctx.logger.info(f"Received REST request: {req}")
-    diagnosis_structured = get_structure_from_raw_text(req.text)
-
-    print(f'Diagnosis Structured : {diagnosis_structured}')
+    with request_context():
+        ctx.logger.info(f"Received REST structuring request of {len(req.text)} chars")
+        diagnosis_structured = await get_structure_from_raw_text(req.text)
 
     return StringResponse(result=diagnosis_structured.json())
 
 @agent.on_rest_post("/diagnosis/raw", request=DiagonsisRawRequest, response=DiagnosisResponse)
 async def diagnosis_raw(ctx: Context, req: DiagonsisRawRequest) -> DiagnosisResponse:
-    ctx.logger.info(f"Received REST raw request: {req}")
-    diagnosis = await get_diagnosis_raw(ctx, req)
+    with request_context():
+        ctx.logger.info(f"Received REST raw request of {len(req.text)} chars")
+        async with track_stage("request_raw"):
+            diagnosis = await get_diagnosis_raw(ctx, req)
 
     return diagnosis
 
 def main():
     setup_logging()
-    build_all_index()
+    asyncio.run(build_all_index())
 
     test_raw()
 
@@ -87,7 +126,7 @@ def test_formatted():
         description=description,
         since=since)
 
-    result = get_diagnosis(request)
+    result = asyncio.run(get_diagnosis(None, request))
 
     print(result)
 
@@ -102,27 +141,6 @@ def test_raw():
     # print(result)
     print("Test function needs proper context to run")
 
-def setup_logging(log_file: str = "app.log"):
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-
-    formatter = logging.Formatter(
-        fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-
-    return logger
-
 protocol = Protocol(spec=chat_protocol_spec)
 @protocol.on_message(ChatMessage)
 async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
@@ -131,39 +149,41 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         ChatAcknowledgement(timestamp=datetime.now(), acknowledged_msg_id=msg.msg_id),
     )
 
-    print(f"======= RECEIVED MESSAGE =======")
-    print(msg.content)
+    with request_context(str(msg.msg_id)):
+        ctx.logger.info(f"Received chat message {msg.msg_id} from {sender}")
+        ctx.logger.debug("Chat message content: %s", payload(msg.content))
 
-    if isinstance(msg.content, list) and len(msg.content) > 0:
-        if isinstance(msg.content[0], StartSessionContent):
+        if isinstance(msg.content, list) and len(msg.content) > 0:
+            if isinstance(msg.content[0], StartSessionContent):
+                return
+        elif isinstance(msg.content, StartSessionContent):
             return
-    elif isinstance(msg.content, StartSessionContent):
-        return
-
-    text = ""
-    for item in msg.content:
-        if isinstance(item, TextContent):
-            text += item.text
 
-    response = "I am afraid something went wrong and I am unable to answer your question at the moment"
-    try:
-        request = DiagonsisRawRequest(text=text)
-        diagnosis_result = await get_diagnosis_raw(ctx, request)
-        response = diagnosis_result.diagnosis
-    except:
-        ctx.logger.exception("Error querying model")
-
-    await ctx.send(
-        sender,
-        ChatMessage(
-            timestamp=datetime.utcnow(),
-            msg_id=uuid4(),
-            content=[
-                TextContent(type="text", text=response),
-                # EndSessionContent(type="end-session"),
-            ],
-        ),
-    )
+        text = ""
+        for item in msg.content:
+            if isinstance(item, TextContent):
+                text += item.text
+
+        response = "I am afraid something went wrong and I am unable to answer your question at the moment"
+        try:
+            request = DiagonsisRawRequest(text=text)
+            async with track_stage("request_chat"):
+                diagnosis_result = await get_diagnosis_raw(ctx, request)
+            response = diagnosis_result.diagnosis
+        except:
+            ctx.logger.exception("Error querying model")
+
+        await ctx.send(
+            sender,
+            ChatMessage(
+                timestamp=datetime.utcnow(),
+                msg_id=uuid4(),
+                content=[
+                    TextContent(type="text", text=response),
+                    # EndSessionContent(type="end-session"),
+                ],
+            ),
+        )
 
 @protocol.on_message(ChatAcknowledgement)
 async def handle_ack(ctx: Context, sender: str, msg: ChatAcknowledgement):
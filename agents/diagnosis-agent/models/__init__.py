@@ -1,9 +1,14 @@
 ﻿from models.symptom import Symptom
 from models.diagnosis_from_symptoms_request import DiagnosisFromSymptomsRequest
 from models.diagnosis_response import DiagnosisResponse
+from models.diagnosis_batch_request import DiagnosisBatchRequest
+from models.diagnosis_batch_response import DiagnosisBatchItem, DiagnosisBatchResponse
 from models.diagnosis_document import DiagnosisDocument
 from models.diagnosis_raw_request import DiagonsisRawRequest
 from models.medicine import Medicine
 from models.recommendation_agent_request import RecommendationAgentRequest
 from models.recommendation_agent_response import RecommendationAgentResponse
-from models.string_response import StringResponse
\ No newline at end of file
+from models.string_response import StringResponse
+from models.resilience_state_response import ResilienceStateResponse
+from models.es_health_response import EsHealthResponse
+from models.scheduler_state_response import SchedulerStateResponse
\ No newline at end of file
@@ -0,0 +1,6 @@
+from typing import List
+from uagents import Model
+from models.diagnosis_from_symptoms_request import DiagnosisFromSymptomsRequest
+
+class DiagnosisBatchRequest(Model):
+    requests: List[DiagnosisFromSymptomsRequest]
\ No newline at end of file
@@ -0,0 +1,11 @@
+from typing import List
+from uagents import Model, Field
+from models.diagnosis_response import DiagnosisResponse
+
+class DiagnosisBatchItem(Model):
+    index: int
+    response: DiagnosisResponse | None = None
+    error: str | None = None
+
+class DiagnosisBatchResponse(Model):
+    results: List[DiagnosisBatchItem] = Field(default_factory=list)
\ No newline at end of file
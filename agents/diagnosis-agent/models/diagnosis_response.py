@@ -1,7 +1,10 @@
-﻿from uagents import Model
+﻿from typing import List
+from uagents import Model, Field
 from models.recommendation_agent_response import RecommendationAgentResponse
 
 class DiagnosisResponse(Model):
-    title: str
+    title: str = ""
     diagnosis: str
-    recommendation_agent_response: RecommendationAgentResponse | None = None
\ No newline at end of file
+    recommendation_agent_response: RecommendationAgentResponse | None = None
+    # Optional stages left out because they missed the request deadline
+    degraded: List[str] = Field(default_factory=list)
\ No newline at end of file
@@ -0,0 +1,5 @@
+from typing import Any, Dict
+from uagents import Model
+
+class EsHealthResponse(Model):
+    stats: Dict[str, Any]
\ No newline at end of file
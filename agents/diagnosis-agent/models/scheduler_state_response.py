@@ -0,0 +1,5 @@
+from typing import Any, Dict
+from uagents import Model
+
+class SchedulerStateResponse(Model):
+    state: Dict[str, Any]
\ No newline at end of file
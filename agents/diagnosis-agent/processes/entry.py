@@ -1,53 +1,135 @@
-import json
-import re
 import asyncio
-from models import DiagnosisFromSymptomsRequest, DiagnosisResponse, DiagonsisRawRequest, Symptom, RecommendationAgentResponse, RecommendationAgentRequest
-from processes.fetch_documents import fetch_documents
-from processes.process_documents import process_documents, get_title_from_result
+import logging
+from google.genai import types
+from models import DiagnosisFromSymptomsRequest, DiagnosisResponse, DiagnosisBatchRequest, DiagnosisBatchItem, DiagnosisBatchResponse, DiagonsisRawRequest, Symptom, RecommendationAgentResponse, RecommendationAgentRequest
+from processes.fetch_documents import fetch_documents, fetch_documents_many
+from processes.process_documents import process_documents, process_documents_with_title, get_title_from_result
+from processes.stage_graph import StageGraph
 from llm import gemini_llm
 from uagents.query import send_sync_message
 from helpers import env_helper
+from helpers.deadline import Deadline, DeadlineExceeded
+from helpers.log_helper import payload
+from helpers.metrics import registry, timed, track_stage
+from helpers.resilience import CircuitOpenError
+from helpers.rate_scheduler import Priority, RateLimitShed
 from datetime import date
+from typing import Any, Awaitable, List
 from uagents import Context
+from models.diagnosis_document import DiagnosisDocument
 
-async def get_diagnosis(ctx: Context, request: DiagnosisFromSymptomsRequest) -> DiagnosisResponse:
-    symptom_formatted = ", ".join(symptom.name for symptom in request.symptoms)
-    documents = fetch_documents(query=symptom_formatted)
-    
-    if not documents:
-        return DiagnosisResponse(diagnosis="No matching medical conditions found for your symptoms.")
-    
-    result = process_documents(
-        request=request,
-        documents=documents
-    )
+logging = logging.getLogger(__name__)
 
-    title = get_title_from_result(result)
+def format_symptoms(request: DiagnosisFromSymptomsRequest) -> str:
+    return ", ".join(symptom.name for symptom in request.symptoms)
 
-    disease = documents[0].name
-    res = await get_recommended_medicine(ctx, disease=disease)
-    print(f"Get Recommended Medicine At Get Diagnosis: {res}")
+TIMED_OUT_DIAGNOSIS = "The diagnosis could not be completed in time. Please try again."
+UNAVAILABLE_DIAGNOSIS = "The diagnosis service is temporarily unavailable. Please try again in a little while."
 
-    return DiagnosisResponse(diagnosis=str(result), recommendation_agent_response=res, title=title)
+DEGRADED_RESPONSES = registry.counter("diagnosis_degraded_total", "Diagnosis responses returned without a stage", ["stage"])
 
-def clean_llm_json(raw: str) -> str:
+async def optional_stage(name: str, awaitable: Awaitable[Any], deadline: Deadline, degraded: List[str], default: Any = None) -> Any:
     """
-    Remove markdown code fences and extra whitespace.
+    Await a stage the response can do without. When it misses the deadline,
+    its API is failing fast behind an open circuit breaker or it was shed
+    to save Gemini quota, it is recorded in degraded and default is
+    returned instead.
     """
-    cleaned = raw.strip()
+    try:
+        return await deadline.run(timed(name, awaitable))
+    except DeadlineExceeded:
+        logging.warning(f"Stage {name} missed the deadline, responding without it")
+        degraded.append(name)
+        DEGRADED_RESPONSES.inc(stage=name)
+        return default
+    except (CircuitOpenError, RateLimitShed) as e:
+        logging.warning(f"Stage {name} skipped: {e}")
+        degraded.append(name)
+        DEGRADED_RESPONSES.inc(stage=name)
+        return default
 
-    cleaned = re.sub(r"^```(json)?", "", cleaned).strip()
+async def get_diagnosis(ctx: Context, request: DiagnosisFromSymptomsRequest, documents: List[DiagnosisDocument] | None = None, deadline: Deadline | None = None) -> DiagnosisResponse:
+    """
+    Run the diagnosis pipeline for one case within deadline, which defaults
+    to DIAGNOSIS_DEADLINE_SECONDS from now. Title and recommendation are
+    optional: when they miss the deadline the response is returned without
+    them and lists them in `degraded`. documents can be passed in when they
+    were already retrieved, as get_diagnosis_batch does.
+    """
+    deadline = deadline or Deadline(env_helper.DIAGNOSIS_DEADLINE_SECONDS)
+    degraded: List[str] = []
+
+    try:
+        if documents is None:
+            documents = await deadline.run(fetch_documents(query=format_symptoms(request)))
 
-    cleaned = re.sub(r"```$", "", cleaned).strip()
+        if not documents:
+            return DiagnosisResponse(diagnosis="No matching medical conditions found for your symptoms.")
 
-    return cleaned
+        disease = documents[0].name
 
-def get_structure_from_raw_text(raw_text: str) -> DiagnosisFromSymptomsRequest:
+        # The recommendation only needs the top document, so it runs alongside
+        # the diagnosis -> title chain instead of after it.
+        graph = StageGraph()
+        if env_helper.DIAGNOSIS_SINGLE_CALL:
+            graph.add("diagnosis_with_title", lambda: deadline.run(timed("diagnosis_with_title", process_documents_with_title(request=request, documents=documents))))
+        else:
+            graph.add("diagnosis", lambda: deadline.run(timed("diagnosis", process_documents(request=request, documents=documents))))
+            graph.add("title", lambda result: optional_stage("title", get_title_from_result(result), deadline, degraded, default=""), depends_on=["diagnosis"])
+        graph.add("recommendation", lambda: optional_stage("recommendation", get_recommended_medicine(ctx, disease=disease, timeout=deadline.remaining()), deadline, degraded))
+        stages = await graph.run()
+    except DeadlineExceeded:
+        logging.warning("Diagnosis missed the deadline")
+        DEGRADED_RESPONSES.inc(stage="diagnosis")
+        return DiagnosisResponse(diagnosis=TIMED_OUT_DIAGNOSIS, degraded=["diagnosis"])
+    except CircuitOpenError as e:
+        logging.warning(f"Diagnosis failed fast: {e}")
+        DEGRADED_RESPONSES.inc(stage="diagnosis")
+        return DiagnosisResponse(diagnosis=UNAVAILABLE_DIAGNOSIS, degraded=["diagnosis"])
+
+    if env_helper.DIAGNOSIS_SINGLE_CALL:
+        title, result = stages["diagnosis_with_title"]
+    else:
+        title, result = stages["title"], stages["diagnosis"]
+
+    res = stages["recommendation"]
+    if res is None and "recommendation" not in degraded:
+        degraded.append("recommendation")
+        DEGRADED_RESPONSES.inc(stage="recommendation")
+    logging.debug("Recommendation for the diagnosis: %s", payload(res))
+
+    return DiagnosisResponse(diagnosis=str(result), recommendation_agent_response=res, title=title, degraded=degraded)
+
+STRUCTURE_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "description": types.Schema(type=types.Type.STRING),
+        "symptoms": types.Schema(
+            type=types.Type.ARRAY,
+            items=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "name": types.Schema(type=types.Type.STRING),
+                    "severity": types.Schema(
+                        type=types.Type.STRING,
+                        enum=["mild", "moderate", "high", "severe"],
+                    ),
+                },
+                required=["name", "severity"],
+            ),
+        ),
+        "since": types.Schema(type=types.Type.STRING, description="Date in YYYY-MM-DD format"),
+    },
+    required=["description", "symptoms", "since"],
+    property_ordering=["description", "symptoms", "since"],
+)
+
+async def get_structure_from_raw_text(raw_text: str) -> DiagnosisFromSymptomsRequest:
     """
     Converts free-text input into a structured DiagnosisFromSymptomsRequest
     using the Gemini LLM.
     """
-    print(f"Structuring raw text: {raw_text}")
+    logging.debug("Structuring raw text: %s", payload(raw_text))
     
     if not raw_text.strip():
         raise ValueError("Empty input text provided")
@@ -79,63 +161,120 @@ Respond only with the JSON, no additional text.
 """
 
     try:
-        print("Calling Gemini LLM for text structuring...")
-        req_json_result = gemini_llm.answer(prompt)
-        print(f'Raw LLM result: {req_json_result}')
-
-        req_json_result = clean_llm_json(req_json_result)
-        print(f'Cleaned: {req_json_result}')
+        async with track_stage("structuring"):
+            parsed = await gemini_llm.answer_json_async(prompt, STRUCTURE_SCHEMA, priority=Priority.CRITICAL)
+            logging.debug("Raw LLM result: %s", payload(parsed))
 
-        parsed = json.loads(req_json_result)
+            response = DiagnosisFromSymptomsRequest(
+                description=parsed['description'],
+                symptoms=[Symptom(**s) for s in parsed["symptoms"]],
+                since=date.fromisoformat(parsed["since"])
+            )
 
-        response = DiagnosisFromSymptomsRequest(
-            description=parsed['description'],
-            symptoms=[Symptom(**s) for s in parsed["symptoms"]],
-            since=date.fromisoformat(parsed["since"])
-        )
-
-        print(f'Successfully structured: {response}')
+        logging.debug("Successfully structured: %s", payload(response))
         return response
 
     except Exception as e:
-        print(f"Error parsing JSON: {e}")
+        logging.error(f"Error structuring the raw text: {e}")
         raise
 
 
+async def get_diagnosis_batch(ctx: Context, batch: DiagnosisBatchRequest) -> DiagnosisBatchResponse:
+    """
+    Diagnose many cases in one request. Documents for every case are
+    retrieved in a single batched search, then the LLM stages of up to
+    DIAGNOSIS_BATCH_CONCURRENCY cases run at the same time. A failing case
+    only fails its own item. The whole batch shares one deadline of
+    DIAGNOSIS_DEADLINE_SECONDS, time spent waiting for a slot included, so
+    cases that did not get to run in time come back timed out.
+    """
+    deadline = Deadline(env_helper.DIAGNOSIS_DEADLINE_SECONDS)
+    requests = batch.requests[:env_helper.DIAGNOSIS_BATCH_MAX_SIZE]
+    try:
+        documents_per_request = await deadline.run(fetch_documents_many([format_symptoms(request) for request in requests]))
+    except DeadlineExceeded:
+        logging.warning("Batch retrieval missed the deadline")
+        documents_per_request = [None] * len(requests)
+    semaphore = asyncio.Semaphore(max(1, env_helper.DIAGNOSIS_BATCH_CONCURRENCY))
+
+    async def diagnose(index: int, request: DiagnosisFromSymptomsRequest, documents: List[DiagnosisDocument] | None) -> DiagnosisBatchItem:
+        if documents is None:
+            return DiagnosisBatchItem(index=index, error="Unable to retrieve medical documents for this case.")
+
+        try:
+            await deadline.run(semaphore.acquire())
+        except DeadlineExceeded:
+            DEGRADED_RESPONSES.inc(stage="diagnosis")
+            return DiagnosisBatchItem(index=index, response=DiagnosisResponse(diagnosis=TIMED_OUT_DIAGNOSIS, degraded=["diagnosis"]))
+
+        try:
+            response = await get_diagnosis(ctx, request, documents=documents, deadline=deadline)
+            return DiagnosisBatchItem(index=index, response=response)
+        except Exception as e:
+            logging.exception(f"Error diagnosing batch item {index}")
+            return DiagnosisBatchItem(index=index, error=str(e))
+        finally:
+            semaphore.release()
+
+    results = await asyncio.gather(*(
+        diagnose(index, request, documents)
+        for index, (request, documents) in enumerate(zip(requests, documents_per_request))
+    ))
+
+    rejected = [
+        DiagnosisBatchItem(index=index, error=f"A batch holds at most {env_helper.DIAGNOSIS_BATCH_MAX_SIZE} cases.")
+        for index in range(len(requests), len(batch.requests))
+    ]
+    return DiagnosisBatchResponse(results=list(results) + rejected)
+
 async def get_diagnosis_raw(ctx: Context, request: DiagonsisRawRequest) -> DiagnosisResponse:
     """
     Handles raw text input by converting it into structured format
     and then running the normal diagnosis pipeline.
     """
+    deadline = Deadline(env_helper.DIAGNOSIS_DEADLINE_SECONDS)
     try:
-        diagnosis_request = get_structure_from_raw_text(request.text)
-        print(diagnosis_request)
+        diagnosis_request = await deadline.run(get_structure_from_raw_text(request.text))
 
-        return await get_diagnosis(ctx, diagnosis_request)
+        return await get_diagnosis(ctx, diagnosis_request, deadline=deadline)
 
+    except DeadlineExceeded:
+        logging.warning("Structuring the raw text missed the deadline")
+        DEGRADED_RESPONSES.inc(stage="diagnosis")
+        return DiagnosisResponse(diagnosis=TIMED_OUT_DIAGNOSIS, degraded=["diagnosis"])
+    except CircuitOpenError as e:
+        logging.warning(f"Structuring the raw text failed fast: {e}")
+        DEGRADED_RESPONSES.inc(stage="diagnosis")
+        return DiagnosisResponse(diagnosis=UNAVAILABLE_DIAGNOSIS, degraded=["diagnosis"])
     except Exception as e:
-        print(f"Error in get_diagnosis_raw: {e}")
+        logging.exception("Error in get_diagnosis_raw")
         return DiagnosisResponse(diagnosis="Error parsing the response from the LLM.")
     
-async def get_recommended_medicine(ctx: Context, disease: str) -> RecommendationAgentResponse:
+async def get_recommended_medicine(ctx: Context, disease: str, timeout: float | None = None) -> RecommendationAgentResponse | None:
+    """
+    Ask the recommendation agent about disease, waiting at most timeout
+    seconds, capped at RECOMMENDATION_TIMEOUT_SECONDS. None when no reply
+    came or the request failed, so the caller reports the stage as degraded.
+    """
+    timeout = env_helper.RECOMMENDATION_TIMEOUT_SECONDS if timeout is None else min(timeout, env_helper.RECOMMENDATION_TIMEOUT_SECONDS)
     try:
         message = RecommendationAgentRequest(
             question=disease
         )
         
-        print(f"Requesting medicine for disease: {disease}")
+        logging.info(f"Requesting medicine for disease: {disease}")
 
         reply, status = await ctx.send_and_receive (
             'agent1qf6c3hmq7l83fepc9u5z86m65m7khul6wnaschjgjp2de8vc8jwfxu8w0m7',
             message,
             response_type=RecommendationAgentResponse,
-            timeout=60
+            timeout=max(1, int(timeout))
         )
         
-        print(f"Get Recommended Medicine Status: {status}")
-        print(f"Get Recommended Medicine Reply: {reply}")
+        logging.info(f"Recommendation agent replied with status {status}")
+        logging.debug("Recommendation agent reply: %s", payload(reply))
 
         return reply
     except Exception as e:
-        print(f"Error getting recommended medicine: {e}")
-        return RecommendationAgentResponse(answer="Unable to get medicine recommendations at this time.")
\ No newline at end of file
+        logging.error(f"Error getting recommended medicine: {e}")
+        return None
\ No newline at end of file
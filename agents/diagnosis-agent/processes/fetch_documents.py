@@ -1,11 +1,39 @@
-from database import ElasticsearchRetriever
+import logging
+from database import ElasticsearchRetriever, symptom_matrix_retriever
 from helpers import env_helper
+from helpers.metrics import timed
 from models import DiagnosisDocument
-from typing import List
+from typing import Dict, List, Sequence
 
-def fetch_documents(query: str, size: int = 5) -> List[DiagnosisDocument]:
+logging = logging.getLogger(__name__)
+
+async def search_medical_index(query: str, size: int) -> List[Dict]:
+    """
+    Run the symptom query on the configured retriever backend. Both backends
+    return hits shaped like Elasticsearch hits.
     """
-    Fetch documents from the Elasticsearch index based on the provided query.
+    if env_helper.RETRIEVER_BACKEND == "embedded":
+        return symptom_matrix_retriever.search(query=query, total_result=size)
+
+    return await ElasticsearchRetriever.search(
+        index=env_helper.MEDICAL_INDEX,
+        query=query,
+        total_result=size,
+        column="Symptoms"
+    )
+
+def to_diagnosis_document(source: Dict) -> DiagnosisDocument:
+    return DiagnosisDocument(
+        name=source['Name'],
+        symptoms=source['Symptoms'].split(','),
+        treatments=source['Treatments'].split(','),
+        symptoms_formatted=source['Symptoms'],
+        treatments_formatted=source['Treatments'],
+    )
+
+async def fetch_documents(query: str, size: int = 5) -> List[DiagnosisDocument]:
+    """
+    Fetch documents from the medical index based on the provided query.
     
     Args:
         query (str): The search query to use for fetching documents.
@@ -15,28 +43,41 @@ def fetch_documents(query: str, size: int = 5) -> List[DiagnosisDocument]:
         list: A list of documents matching the query.
     """
     try:
-        print(f"Query: {query} Index: {env_helper.MEDICAL_INDEX}")
-        informations: List[DiagnosisDocument] = []
-        documents = ElasticsearchRetriever.search(
-            index=env_helper.MEDICAL_INDEX,
-            query=query,
-            total_result=size,
-            column="Symptoms"
-        )
-
-        for document in documents:
-            source = document['_source']
-            diagnosis_document = DiagnosisDocument(
-                name=source['Name'],
-                symptoms=source['Symptoms'].split(','),
-                treatments=source['Treatments'].split(','),
-                symptoms_formatted=source['Symptoms'],
-                treatments_formatted=source['Treatments'],
-            )
-
-            informations.append(diagnosis_document)
-
-        return informations
+        logging.debug(f"Query: {query} Index: {env_helper.MEDICAL_INDEX} Backend: {env_helper.RETRIEVER_BACKEND}")
+        documents = await timed("retrieval", search_medical_index(query=query, size=size))
+
+        return [to_diagnosis_document(document['_source']) for document in documents]
     except Exception as e:
-        print(f"Error fetching documents: {e}")
-        return []
\ No newline at end of file
+        logging.error(f"Error fetching documents: {e}")
+        return []
+
+async def search_medical_index_many(queries: Sequence[str], size: int) -> List[List[Dict] | None]:
+    """Batched search_medical_index: one _msearch, or one scoring pass on the embedded backend"""
+    if env_helper.RETRIEVER_BACKEND == "embedded":
+        return symptom_matrix_retriever.search_many(queries=queries, total_result=size)
+
+    return await ElasticsearchRetriever.search_many(
+        index=env_helper.MEDICAL_INDEX,
+        queries=queries,
+        total_result=size,
+        column="Symptoms"
+    )
+
+async def fetch_documents_many(queries: Sequence[str], size: int = 5) -> List[List[DiagnosisDocument] | None]:
+    """
+    Fetch the documents of several queries at once.
+
+    Returns:
+        list: The documents of every query in order, or None for a query whose search failed.
+    """
+    try:
+        logging.debug(f"Batch of {len(queries)} queries Index: {env_helper.MEDICAL_INDEX} Backend: {env_helper.RETRIEVER_BACKEND}")
+        hits_per_query = await timed("retrieval_batch", search_medical_index_many(queries=queries, size=size))
+    except Exception as e:
+        logging.error(f"Error fetching documents: {e}")
+        return [None] * len(queries)
+
+    return [
+        None if hits is None else [to_diagnosis_document(hit['_source']) for hit in hits]
+        for hits in hits_per_query
+    ]
@@ -1,6 +1,28 @@
-﻿from models import DiagnosisDocument, DiagnosisFromSymptomsRequest
+﻿import logging
+from google.genai import types
+from models import DiagnosisDocument, DiagnosisFromSymptomsRequest
 from llm import gemini_llm
-from typing import List
+from helpers.log_helper import payload
+from helpers.rate_scheduler import Priority
+from typing import List, Tuple
+
+logging = logging.getLogger(__name__)
+
+DIAGNOSIS_WITH_TITLE_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "diagnosis": types.Schema(
+            type=types.Type.STRING,
+            description="The probable diagnosis for the patient, based on the information above",
+        ),
+        "title": types.Schema(
+            type=types.Type.STRING,
+            description="A short headline summarizing the diagnosis",
+        ),
+    },
+    required=["diagnosis", "title"],
+    property_ordering=["diagnosis", "title"],
+)
 
 def format_informations(request: DiagnosisFromSymptomsRequest, documents: List[DiagnosisDocument]) -> str:
     symptoms_formatted = "".join([f'- {symptom.name} - {symptom.severity}\n' for symptom in request.symptoms])
@@ -26,16 +48,35 @@ def format_informations(request: DiagnosisFromSymptomsRequest, documents: List[D
 
     return patient_description + database_information
 
-def process_documents(request: DiagnosisFromSymptomsRequest, documents: List[DiagnosisDocument]):
+async def process_documents(request: DiagnosisFromSymptomsRequest, documents: List[DiagnosisDocument]) -> str:
     prompt = format_informations(request, documents)
-    print(f"prompt: {prompt}")
+    logging.debug("Prompt: %s", payload(prompt))
+
+    return await gemini_llm.answer_async(prompt, priority=Priority.CRITICAL)
+
+async def process_documents_with_title(request: DiagnosisFromSymptomsRequest, documents: List[DiagnosisDocument]) -> Tuple[str, str]:
+    """
+    Generate the diagnosis and its title in a single schema-constrained call,
+    saving the separate title round trip.
+
+    Returns:
+        tuple: The title and the diagnosis.
+    """
+    prompt = "".join([
+        format_informations(request, documents),
+        '\nGive the most probable diagnosis for the patient in "diagnosis", ',
+        'and a short title for that diagnosis (just the title) in "title".\n'
+    ])
+    logging.debug("Prompt: %s", payload(prompt))
 
-    return gemini_llm.answer(prompt)
+    result = await gemini_llm.answer_json_async(prompt, DIAGNOSIS_WITH_TITLE_SCHEMA, priority=Priority.CRITICAL)
+    return result["title"], result["diagnosis"]
 
-def get_title_from_result(result: str) -> str:
+async def get_title_from_result(result: str) -> str:
     prompt = "".join([
         'Can you make me a title from the sentence below (just the title)\n\n',
         result
     ])
 
-    return gemini_llm.answer(prompt)
\ No newline at end of file
+    # Cosmetic, so it is the first call shed when the quota runs short
+    return await gemini_llm.answer_async(prompt, priority=Priority.LOW)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Sequence, Tuple
+
+class StageGraph:
+    """
+    A small dependency graph of async stages.
+
+    Every stage is started as its own task and only waits for the stages it
+    depends on, so independent branches run concurrently and the whole graph
+    takes as long as its slowest branch.
+    """
+    def __init__(self):
+        self.stages: Dict[str, Tuple[Callable[..., Awaitable[Any]], Sequence[str]]] = {}
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], depends_on: Sequence[str] = ()) -> "StageGraph":
+        """
+        Register a stage. The results of the stages in depends_on are passed
+        to func as positional arguments, in the same order.
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already registered")
+
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+
+        self.stages[name] = (func, tuple(depends_on))
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run every stage and join them.
+
+        Returns:
+            dict: The result of each stage keyed by its name.
+        """
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str):
+            func, depends_on = self.stages[name]
+            arguments = [await tasks[dependency] for dependency in depends_on]
+            return await func(*arguments)
+
+        for name in self.stages:
+            tasks[name] = asyncio.create_task(run_stage(name), name=name)
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        return {name: task.result() for name, task in tasks.items()}
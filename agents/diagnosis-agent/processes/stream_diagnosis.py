@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, Tuple
+from models import DiagnosisFromSymptomsRequest, DiagonsisRawRequest
+from processes.entry import DEGRADED_RESPONSES, TIMED_OUT_DIAGNOSIS, format_symptoms, get_recommended_medicine, get_structure_from_raw_text
+from processes.fetch_documents import fetch_documents
+from processes.process_documents import format_informations, get_title_from_result
+from llm import gemini_llm
+from helpers import env_helper
+from helpers.deadline import Deadline, DeadlineExceeded
+from helpers.metrics import timed
+from helpers.rate_scheduler import Priority, RateLimitShed
+from helpers.resilience import CircuitOpenError
+from uagents import Context
+
+StreamEvent = Tuple[str, Dict[str, Any]]
+
+def timed_out() -> StreamEvent:
+    DEGRADED_RESPONSES.inc(stage="diagnosis")
+    return "diagnosis", {"text": TIMED_OUT_DIAGNOSIS}
+
+async def stream_diagnosis(ctx: Context, request: DiagnosisFromSymptomsRequest, deadline: Deadline | None = None) -> AsyncIterator[StreamEvent]:
+    """
+    The diagnosis pipeline as a sequence of (event, data) pairs, emitted as
+    soon as each part is known: the retrieved documents first, then the
+    diagnosis token by token, then the title and the recommendation in
+    whichever order they finish. Everything runs within deadline, which
+    defaults to DIAGNOSIS_DEADLINE_SECONDS from now. A diagnosis that misses
+    it ends with the timed out text, a title or recommendation that never
+    arrived is reported as a `degraded` event.
+    """
+    deadline = deadline or Deadline(env_helper.DIAGNOSIS_DEADLINE_SECONDS)
+    try:
+        documents = await deadline.run(fetch_documents(query=format_symptoms(request)))
+    except DeadlineExceeded:
+        yield "degraded", {"stage": "diagnosis"}
+        yield timed_out()
+        return
+
+    yield "retrieval", {
+        "documents": [{"name": document.name, "symptoms": document.symptoms_formatted} for document in documents]
+    }
+
+    if not documents:
+        yield "diagnosis", {"text": "No matching medical conditions found for your symptoms."}
+        return
+
+    pending: Dict[asyncio.Task, str] = {
+        asyncio.create_task(deadline.run(timed("recommendation", get_recommended_medicine(ctx, disease=documents[0].name, timeout=deadline.remaining())))): "recommendation"
+    }
+    tokens = gemini_llm.stream_async(format_informations(request, documents), priority=Priority.CRITICAL)
+    try:
+        diagnosis = ""
+        try:
+            while True:
+                try:
+                    text = await deadline.run(tokens.__anext__())
+                except StopAsyncIteration:
+                    break
+                diagnosis += text
+                yield "token", {"text": text}
+        except DeadlineExceeded:
+            yield "degraded", {"stage": "diagnosis"}
+            yield timed_out()
+            return
+        yield "diagnosis", {"text": diagnosis}
+
+        pending[asyncio.create_task(deadline.run(timed("title", get_title_from_result(diagnosis))))] = "title"
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = pending.pop(task)
+                if isinstance(task.exception(), (DeadlineExceeded, CircuitOpenError, RateLimitShed)):
+                    DEGRADED_RESPONSES.inc(stage=name)
+                    yield "degraded", {"stage": name}
+                elif name == "title":
+                    yield "title", {"title": task.result()}
+                elif task.result() is None:
+                    DEGRADED_RESPONSES.inc(stage=name)
+                    yield "degraded", {"stage": "recommendation"}
+                else:
+                    yield "recommendation", task.result().dict()
+    finally:
+        # The client may disconnect mid stream
+        for task in pending:
+            task.cancel()
+        await tokens.aclose()
+
+async def stream_diagnosis_raw(ctx: Context, request: DiagonsisRawRequest) -> AsyncIterator[StreamEvent]:
+    """
+    stream_diagnosis for free text, preceded by the structured request it
+    was turned into. Structuring shares the deadline of the rest of the stream.
+    """
+    deadline = Deadline(env_helper.DIAGNOSIS_DEADLINE_SECONDS)
+    try:
+        structured = await deadline.run(get_structure_from_raw_text(request.text))
+    except DeadlineExceeded:
+        yield "degraded", {"stage": "diagnosis"}
+        yield timed_out()
+        return
+
+    yield "structured", {
+        "description": structured.description,
+        "symptoms": [symptom.dict() for symptom in structured.symptoms],
+        "since": structured.since.isoformat(),
+    }
+
+    async for event in stream_diagnosis(ctx, structured, deadline=deadline):
+        yield event
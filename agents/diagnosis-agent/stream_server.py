@@ -0,0 +1,66 @@
+import asyncio
+import json
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic.v1 import ValidationError
+from helpers.log_helper import request_context
+from helpers.metrics import registry
+from models import DiagonsisRawRequest
+from processes.stream_diagnosis import stream_diagnosis_raw
+from uagents import Context
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def create_stream_app(ctx: Context) -> FastAPI:
+    """
+    HTTP routes that uagents REST handlers cannot serve, since those return
+    a single model. ctx is the agent context used to reach the
+    recommendation agent.
+    """
+    app = FastAPI(title="Diagnosis Streaming API")
+
+    @app.post("/diagnosis/raw/stream")
+    async def diagnosis_raw_stream(request: Request):
+        """
+        Server-Sent Events version of /diagnosis/raw. Emits `structured`,
+        `retrieval`, `token` (repeated), `diagnosis`, `title` and
+        `recommendation` (or `degraded`) events, then `done`, or `error` when
+        it fails. An X-Request-ID header is used as the correlation id of
+        its log records.
+        """
+        try:
+            raw_request = DiagonsisRawRequest(**await request.json())
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=400, detail=f"Bad request: {str(e)}")
+
+        request_id = request.headers.get("X-Request-ID")
+
+        async def events():
+            with request_context(request_id):
+                try:
+                    async for event, data in stream_diagnosis_raw(ctx, raw_request):
+                        yield format_sse(event, data)
+                    yield format_sse("done", {})
+                except Exception as e:
+                    ctx.logger.exception("Error streaming diagnosis")
+                    yield format_sse("error", {"message": str(e)})
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        """Stage latencies, errors, in-flight stages, cache hit ratios and Gemini quota in the Prometheus text format"""
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+def start_stream_server(ctx: Context, port: int) -> asyncio.Task:
+    """Serve create_stream_app on port from the agent's own event loop"""
+    config = uvicorn.Config(create_stream_app(ctx), host="0.0.0.0", port=port, log_level="info")
+    return asyncio.create_task(uvicorn.Server(config).serve())
@@ -1,3 +1,4 @@
+import asyncio
 import requests
 import json
 from uagents_core.contrib.protocols.chat import (
@@ -7,10 +8,12 @@ from uagents_core.contrib.protocols.chat import (
     TextContent,
     StartSessionContent,
 )
-from uagents import Agent, Context, Protocol
+from uagents import Agent, Context, Model, Protocol
 from datetime import datetime, timezone, timedelta
 from uuid import uuid4
 from config import ConfigLoader
+from resilience import CircuitOpenError, get_endpoint, resilience_state
+from typing import Any, Dict
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,6 +24,17 @@ ASI1_HEADERS = {
     "Authorization": f"Bearer {ASI1_API_KEY}",
     "Content-Type": "application/json"
 }
+ASI1_TIMEOUT_SECONDS = ConfigLoader.get_float("ASI1_TIMEOUT_SECONDS", 30.0)
+
+asi1_endpoint = get_endpoint(
+    "asi1",
+    max_attempts=ConfigLoader.get_int("RESILIENCE_MAX_ATTEMPTS", 3),
+    base_delay=ConfigLoader.get_float("RESILIENCE_BASE_DELAY", 0.2),
+    max_delay=ConfigLoader.get_float("RESILIENCE_MAX_DELAY", 5.0),
+    failure_threshold=ConfigLoader.get_int("RESILIENCE_FAILURE_THRESHOLD", 5),
+    recovery_timeout=ConfigLoader.get_float("RESILIENCE_RECOVERY_SECONDS", 30.0),
+    retry_budget_ratio=ConfigLoader.get_float("RESILIENCE_RETRY_BUDGET_RATIO", 0.2),
+)
 
 HISTORY_CANISTER_ID = ConfigLoader.get_str("HISTORY_CANISTER_ID")
 USER_CANISTER_ID = ConfigLoader.get_str("USER_CANISTER_ID")
@@ -76,6 +90,20 @@ async def call_backend_endpoint(func_name: str, args: dict):
     else:
         raise ValueError(f"Unsupported function call: {func_name}")
 
+async def post_chat_completion(payload: dict) -> dict:
+    """POST to ASI1 chat completions off the event loop, with retries and a circuit breaker"""
+    def post() -> dict:
+        response = requests.post(
+            f"{ASI1_BASE_URL}/chat/completions",
+            headers=ASI1_HEADERS,
+            json=payload,
+            timeout=ASI1_TIMEOUT_SECONDS
+        )
+        response.raise_for_status()
+        return response.json()
+
+    return await asi1_endpoint.call(lambda: asyncio.to_thread(post))
+
 async def process_query(query: str, ctx: Context) -> str:
     try:
         initial_message = {
@@ -89,13 +117,7 @@ async def process_query(query: str, ctx: Context) -> str:
             "temperature": 0.7,
             "max_tokens": 1024
         }
-        response = requests.post(
-            f"{ASI1_BASE_URL}/chat/completions",
-            headers=ASI1_HEADERS,
-            json=payload
-        )
-        response.raise_for_status()
-        response_json = response.json()
+        response_json = await post_chat_completion(payload)
         print(response_json)
 
         tool_calls = response_json["choices"][0]["message"].get("tool_calls", [])
@@ -139,16 +161,13 @@ async def process_query(query: str, ctx: Context) -> str:
             "temperature": 0.7,
             "max_tokens": 1024
         }
-        final_response = requests.post(
-            f"{ASI1_BASE_URL}/chat/completions",
-            headers=ASI1_HEADERS,
-            json=final_payload
-        )
-        final_response.raise_for_status()
-        final_response_json = final_response.json()
+        final_response_json = await post_chat_completion(final_payload)
 
         return final_response_json["choices"][0]["message"]["content"]
 
+    except CircuitOpenError as e:
+        ctx.logger.warning(f"Failing fast: {str(e)}")
+        return "The history service is temporarily unavailable. Please try again in a little while."
     except Exception as e:
         ctx.logger.error(f"Error processing query: {str(e)}")
         return f"An error occurred while processing your request: {str(e)}"
@@ -162,6 +181,13 @@ agent = Agent(
 )
 chat_proto = Protocol(spec=chat_protocol_spec)
 
+class ResilienceStateResponse(Model):
+    endpoints: Dict[str, Dict[str, Any]]
+
+@agent.on_rest_get("/resilience", response=ResilienceStateResponse)
+async def resilience(ctx: Context) -> ResilienceStateResponse:
+    return ResilienceStateResponse(endpoints=resilience_state())
+
 @chat_proto.on_message(model=ChatMessage)
 async def handle_chat_message(ctx: Context, sender: str, msg: ChatMessage):
     try:
@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import pytest
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+
+class FakeServer:
+    """
+    HTTP server answering every POST with the next status of a script,
+    200 with body once the script runs out, and counting the requests.
+    """
+    def __init__(self):
+        self.statuses: List[int] = []
+        self.body = b"{}"
+        self.hits = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def script(self, *statuses: int, body: bytes = b"{}"):
+        with self._lock:
+            self.statuses = list(statuses)
+            self.body = body
+            self.hits = 0
+
+    def _next_status(self) -> int:
+        with self._lock:
+            self.hits += 1
+            return self.statuses.pop(0) if self.statuses else 200
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status = server._next_status()
+                body = server.body if status == 200 else b'{"error": "scripted"}'
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+@pytest.fixture(scope="session")
+def fake_server():
+    server = FakeServer()
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
@@ -0,0 +1,167 @@
+import asyncio
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+import requests
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, ResilientEndpoint, RetryBudget
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def post(server) -> dict:
+    response = requests.post(f"{server.url}/chat/completions", json={}, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+def endpoint(**settings) -> ResilientEndpoint:
+    settings = {"max_attempts": 3, "base_delay": 0.0, "failure_threshold": 10, **settings}
+    return ResilientEndpoint("fake", **settings)
+
+def test_transient_errors_are_retried(fake_server):
+    fake_server.script(503, 429, body=b'{"ok": true}')
+    guarded = endpoint()
+
+    assert guarded.call_sync(lambda: post(fake_server)) == {"ok": True}
+    assert fake_server.hits == 3
+    assert guarded.retries == 2
+    assert guarded.breaker.state == CLOSED
+
+def test_async_call_retries_like_call_sync(fake_server):
+    fake_server.script(503, body=b'{"ok": true}')
+    guarded = endpoint()
+
+    assert asyncio.run(guarded.call(lambda: asyncio.to_thread(post, fake_server))) == {"ok": True}
+    assert fake_server.hits == 2
+    assert guarded.retries == 1
+
+def test_attempts_are_bounded(fake_server):
+    fake_server.script(503, 503, 503, 503)
+    guarded = endpoint()
+
+    with pytest.raises(requests.HTTPError):
+        guarded.call_sync(lambda: post(fake_server))
+    assert fake_server.hits == 3
+    assert guarded.retries == 2
+
+def test_client_errors_are_not_retried(fake_server):
+    fake_server.script(400)
+    guarded = endpoint(failure_threshold=1)
+
+    with pytest.raises(requests.HTTPError):
+        guarded.call_sync(lambda: post(fake_server))
+    assert fake_server.hits == 1
+    assert guarded.breaker.state == CLOSED
+
+def test_retry_budget_runs_dry(fake_server):
+    guarded = endpoint()
+    guarded.budget = RetryBudget(ratio=0.0, min_per_second=0.0, max_tokens=1.0)
+
+    fake_server.script(503, 503, 503)
+    with pytest.raises(requests.HTTPError):
+        guarded.call_sync(lambda: post(fake_server))
+    # One token, so a single retry
+    assert fake_server.hits == 2
+
+    fake_server.script(503, 503, 503)
+    with pytest.raises(requests.HTTPError):
+        guarded.call_sync(lambda: post(fake_server))
+    assert fake_server.hits == 1
+    assert guarded.budget.exhausted == 2
+    assert guarded.retries == 1
+
+def test_breaker_opens_and_half_opens(fake_server):
+    clock = FakeClock()
+    guarded = endpoint(max_attempts=1, failure_threshold=2, recovery_timeout=30.0, clock=clock)
+
+    fake_server.script(503, 503)
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            guarded.call_sync(lambda: post(fake_server))
+    assert guarded.breaker.state == OPEN
+
+    # Fails fast without reaching the server
+    fake_server.script()
+    with pytest.raises(CircuitOpenError) as error:
+        guarded.call_sync(lambda: post(fake_server))
+    assert fake_server.hits == 0
+    assert error.value.retry_after == pytest.approx(30.0)
+    assert guarded.rejected == 1
+
+    # A failed trial reopens the breaker
+    clock.now += 30.0
+    fake_server.script(503)
+    with pytest.raises(requests.HTTPError):
+        guarded.call_sync(lambda: post(fake_server))
+    assert fake_server.hits == 1
+    assert guarded.breaker.state == OPEN
+
+    # A successful trial closes it
+    clock.now += 30.0
+    fake_server.script()
+    guarded.call_sync(lambda: post(fake_server))
+    assert guarded.breaker.state == CLOSED
+    assert guarded.breaker.times_opened == 2
+
+def test_half_open_lets_a_single_trial_through():
+    clock = FakeClock()
+    guarded = endpoint(max_attempts=1, failure_threshold=1, recovery_timeout=1.0, clock=clock)
+    guarded.breaker.record_failure()
+    clock.now += 1.0
+
+    guarded.breaker.before_call(guarded.name)
+    assert guarded.breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        guarded.breaker.before_call(guarded.name)
+
+def test_failures_after_the_call_count_toward_the_breaker():
+    guarded = endpoint(failure_threshold=2)
+    guarded.report_failure(ConnectionError("stream broke off"))
+    guarded.report_failure(ValueError("not transient"))
+    assert guarded.breaker.state == CLOSED
+
+    guarded.report_failure(ConnectionError("stream broke off"))
+    assert guarded.breaker.state == OPEN
+    assert guarded.failures == 2
+
+@pytest.fixture
+def history_agent(fake_server, monkeypatch, tmp_path):
+    # uagents keeps the generated agent key in the working directory
+    shutil.copy(os.path.join(AGENT_DIR, "README.md"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ASI1_API_KEY", "test")
+    monkeypatch.setenv("ASI1_BASE_URL", fake_server.url)
+    monkeypatch.setenv("RESILIENCE_MAX_ATTEMPTS", "2")
+    monkeypatch.setenv("RESILIENCE_BASE_DELAY", "0")
+    monkeypatch.setenv("RESILIENCE_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("RESILIENCE_RECOVERY_SECONDS", "60")
+    # get_endpoint would hand back the endpoint of an earlier import
+    monkeypatch.setattr(resilience, "_endpoints", {})
+    # The uagents Agent built on import asks for the current event loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+    yield importlib.import_module("main")
+    loop.close()
+
+def test_post_chat_completion_fails_fast_once_open(history_agent, fake_server):
+    fake_server.script(503, 503)
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(history_agent.post_chat_completion({"model": "asi1-mini", "messages": []}))
+    assert fake_server.hits == 2
+    assert history_agent.asi1_endpoint.breaker.state == OPEN
+
+    fake_server.script()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(history_agent.post_chat_completion({"model": "asi1-mini", "messages": []}))
+    assert fake_server.hits == 0
@@ -1,3 +1,3 @@
-from .agent import RecommendationAgent
+from .agent import ERROR_ANSWER, OVERLOADED_ANSWER, UNAVAILABLE_ANSWER, RecommendationAgent
 
-__all__ = ["RecommendationAgent"]
+__all__ = ["ERROR_ANSWER", "OVERLOADED_ANSWER", "UNAVAILABLE_ANSWER", "RecommendationAgent"]
\ No newline at end of file
@@ -1,13 +1,30 @@
+import asyncio
 import os
+import time
 from uagents import Agent, Context
-from models.api import RecommendationAgentRequest, RecommendationAgentResponse
+from models.api import EsHealthResponse, RecommendationAgentRequest, RecommendationAgentResponse, ResilienceStateResponse
 from config import EnvLoader
-from services import OpenFDAService, RecommendationService
+from services import IngestionManifest, OpenFDAService, RecommendationService, RequestPool, RequestPoolOverloaded, close_es_client, es_health_stats
+from services.metrics import registry, start_metrics_server, track_stage
+from services.resilience import CircuitOpenError, resilience_state
+from services.recommendation_precompute import current_index_version, load_disease_names, precompute_recommendations
+
+OVERLOADED_ANSWER = "I am receiving too many requests at the moment. Please try again in a little while."
+ERROR_ANSWER = "I am afraid something went wrong and I am unable to answer your question at the moment"
+UNAVAILABLE_ANSWER = "The recommendation service is temporarily unavailable. Please try again in a little while."
 
 class RecommendationAgent:
     def __init__(self):
         self.seed_value = EnvLoader.get_str("SEED_VALUE")
         self.recommendation_service = RecommendationService()
+        self.request_pool = RequestPool(
+            concurrency=EnvLoader.get_int("RECOMMENDATION_CONCURRENCY", 8),
+            max_queue_size=EnvLoader.get_int("RECOMMENDATION_QUEUE_SIZE", 64)
+        )
+        self._precompute_task: asyncio.Task | None = None
+        self._metrics_server: asyncio.Future | None = None
+        self.queue_wait = registry.histogram("request_queue_wait_seconds", "Time questions waited in the request pool queue")
+        registry.add_collector(self._collect_metrics)
         
         self.agent = Agent(
             name="Recommendation Agent",
@@ -21,54 +38,203 @@ class RecommendationAgent:
         self._register_handlers()
     
     def _register_handlers(self):
-        self.agent.on_message(model=RecommendationAgentRequest, replies=RecommendationAgentResponse)(self.handle_ai_request)
+        # The reply is sent by a pool worker after the handler returned, so no
+        # replies are declared here, uagents would flag the handler otherwise
+        self.agent.on_message(model=RecommendationAgentRequest)(self.handle_ai_request)
         self.agent.on_event("startup")(self._startup_handler)
+        self.agent.on_event("shutdown")(self._shutdown_handler)
+        self.agent.on_interval(period=60.0)(self._log_pool_stats)
+        self.agent.on_rest_get("/resilience", response=ResilienceStateResponse)(self._resilience_state)
+        self.agent.on_rest_get("/es/health", response=EsHealthResponse)(self._es_health)
+        self.agent.on_interval(period=float(EnvLoader.get_int("RECOMMENDATION_TABLE_CHECK_SECONDS", 300)))(self._sync_recommendation_table)
     
     async def handle_ai_request(self, ctx: Context, sender: str, msg: RecommendationAgentRequest):
+        """
+        uagents runs message handlers one at a time, so the question is only
+        queued here and answered by one of the request pool workers.
+        """
         ctx.logger.info(f"Received question from {sender}: {msg.question}")
-        response_text, medicine_list = self.recommendation_service.send_query(msg.question)
+        submitted_at = time.perf_counter()
+        try:
+            self.request_pool.submit(lambda: self._answer_request(ctx, sender, msg, submitted_at))
+        except RequestPoolOverloaded as e:
+            ctx.logger.warning(f"Rejecting question from {sender}, the request pool is full: {e}")
+            await ctx.send(sender, RecommendationAgentResponse(answer=OVERLOADED_ANSWER, medicines=[]))
+
+    async def _answer_request(self, ctx: Context, sender: str, msg: RecommendationAgentRequest, submitted_at: float):
+        waited = time.perf_counter() - submitted_at
+        self.queue_wait.observe(waited)
+        ctx.logger.info(f"Question from {sender} waited {waited * 1000:.0f}ms in the queue")
+        try:
+            async with track_stage("answer"):
+                response_text, medicine_list = await self.recommendation_service.send_query(msg.question)
+        except CircuitOpenError as e:
+            ctx.logger.warning(f"Failing fast: {e}")
+            response_text, medicine_list = UNAVAILABLE_ANSWER, []
+        except Exception:
+            ctx.logger.exception("Error querying model")
+            response_text, medicine_list = ERROR_ANSWER, []
+
         ctx.logger.info(f"Response: {response_text}")
         ctx.logger.info(f"Medicines: {medicine_list}")
         await ctx.send(sender, RecommendationAgentResponse(answer=response_text, medicines=medicine_list))
+
+    async def _resilience_state(self, ctx: Context) -> ResilienceStateResponse:
+        return ResilienceStateResponse(endpoints=resilience_state())
+
+    async def _es_health(self, ctx: Context) -> EsHealthResponse:
+        return EsHealthResponse(stats=await es_health_stats())
+
+    def _collect_metrics(self):
+        stats = self.request_pool.stats()
+        registry.gauge("request_pool_queued", "Questions waiting for a request pool worker").set(stats["queued"])
+        registry.gauge("request_pool_in_flight", "Questions being answered by the request pool").set(stats["in_flight"])
+        registry.counter("request_pool_rejected_total", "Questions rejected by a full request pool since start").set_total(stats["rejected"])
+        registry.gauge("recommendation_in_flight_queries", "Distinct questions being computed right now").set(len(self.recommendation_service._in_flight))
+
+        circuit_open = registry.gauge("circuit_open", "1 while the endpoint's circuit breaker rejects calls", ["endpoint"])
+        for name, state in resilience_state().items():
+            circuit_open.set(int(state["state"] != "closed"), endpoint=name)
+
+    async def _log_pool_stats(self, ctx: Context):
+        stats = self.request_pool.stats()
+        if stats["processed"] or stats["rejected"] or stats["in_flight"]:
+            ctx.logger.info(f"Request pool: {stats}")
+            ctx.logger.info(f"Query coalescing: {self.recommendation_service.coalescing_stats()}")
     
     async def _startup_handler(self, ctx: Context):
         ctx.logger.info(f"Agent address: {self.agent.address}")
+
+        metrics_port = EnvLoader.get_int("METRICS_PORT", 8010)
+        if metrics_port > 0:
+            ctx.logger.info(f"Serving /metrics on port {metrics_port}")
+            self._metrics_server = start_metrics_server(metrics_port)
         
         try:
             await self._initialize_elasticsearch(ctx)
         except Exception as e:
             ctx.logger.error(f"Error initializing Elasticsearch: {e}")
+
+        await self._sync_recommendation_table(ctx)
+
+    async def _sync_recommendation_table(self, ctx: Context):
+        """
+        Serve the precomputed answers of the live openFDA index version. When the
+        version changed, its missing answers are regenerated in the background
+        and served as they are stored.
+        """
+        table = self.recommendation_service.recommendation_table
+        try:
+            index_version = await current_index_version(self.recommendation_service.openfda_service)
+        except Exception as e:
+            ctx.logger.error(f"Error reading the openFDA index version: {e}")
+            return
+
+        if index_version is None or index_version == table.index_version:
+            return
+
+        await asyncio.to_thread(table.use_version, index_version)
+        # Cached live answers were generated against the previous version
+        self.recommendation_service.result_cache.clear()
+        ctx.logger.info(f"Serving {len(table)} precomputed recommendations for index version {index_version}")
+
+        if not EnvLoader.get_int("RECOMMENDATION_PRECOMPUTE_ON_VERSION_CHANGE", 1):
+            return
+        if self._precompute_task is not None and not self._precompute_task.done():
+            ctx.logger.info("A recommendation precompute is still running, the new version is picked up on the next check")
+            return
+
+        self._precompute_task = asyncio.create_task(self._precompute_recommendations(ctx, index_version))
+
+    async def _precompute_recommendations(self, ctx: Context, index_version: str):
+        try:
+            questions = await asyncio.to_thread(load_disease_names)
+            await precompute_recommendations(
+                self.recommendation_service,
+                self.recommendation_service.recommendation_table,
+                index_version,
+                questions,
+                concurrency=EnvLoader.get_int("RECOMMENDATION_PRECOMPUTE_CONCURRENCY", 2)
+            )
+        except Exception as e:
+            ctx.logger.error(f"Error precomputing recommendations: {e}")
     
+    async def _shutdown_handler(self, ctx: Context):
+        if self._precompute_task is not None:
+            self._precompute_task.cancel()
+        await self.request_pool.stop()
+        await close_es_client()
+        if self._metrics_server is not None and self._metrics_server.done() and not self._metrics_server.cancelled() and self._metrics_server.exception() is None:
+            self._metrics_server.result().close()
+
     async def _initialize_elasticsearch(self, ctx: Context):
-        openfda_service = OpenFDAService()
+        # Shares the pooled client with the service that answers queries
+        openfda_service = self.recommendation_service.openfda_service
         
-        if not openfda_service.check_connection():
+        if not await openfda_service.check_connection():
             ctx.logger.error("Failed to connect to Elasticsearch")
             return
             
         ctx.logger.info("Elasticsearch connection successful")
         
-        if not openfda_service.es_client.indices.exists(index=openfda_service.index_name):
-            ctx.logger.info("Creating index and indexing data...")
-            openfda_service.create_index()
-            await self._index_openfda_data(ctx, openfda_service)
+        manifest = IngestionManifest(EnvLoader.get_str("OPENFDA_MANIFEST_PATH", "./state/openfda_manifest.json"))
+        live_indices = await openfda_service.get_alias_targets()
+
+        if manifest.index_name and manifest.index_name in live_indices:
+            pending, _, removed = openfda_service.plan_sync(self._openfda_files(), manifest)
+            if not pending and not removed:
+                ctx.logger.info(f"{manifest.index_name} is up to date with the openFDA files")
+                return
+
+            # The live version is never edited: unchanged documents are copied
+            # into a new version, which is synced and then promoted
+            ctx.logger.info(f"Syncing {len(pending)} new or changed and {len(removed)} removed files into a new version...")
+            version_name = await openfda_service.create_index()
+            await openfda_service.copy_index(manifest.index_name, version_name, exclude_files=pending + removed)
+            manifest.fork(version_name, drop=pending + removed)
+            await self._build_index_version(ctx, openfda_service, version_name, manifest)
+            return
+
+        if manifest.index_name and await openfda_service.es_client.indices.exists(index=manifest.index_name):
+            ctx.logger.info(f"Resuming the interrupted build of {manifest.index_name}...")
+            version_name = manifest.index_name
         else:
-            doc_count = openfda_service.es_client.count(index=openfda_service.index_name)['count']
-            if doc_count == 0:
-                ctx.logger.info("Index exists but is empty. Indexing data...")
-                await self._index_openfda_data(ctx, openfda_service)
+            if live_indices:
+                ctx.logger.info("The live index has no ingestion manifest. Rebuilding it into a new version...")
             else:
-                ctx.logger.info(f"Index already exists with {doc_count} documents. Skipping indexing.")
+                ctx.logger.info("Building a new index version and indexing data...")
+            version_name = await openfda_service.create_index()
+            manifest.reset(version_name)
+
+        await self._build_index_version(ctx, openfda_service, version_name, manifest)
+
+    async def _build_index_version(self, ctx: Context, openfda_service: OpenFDAService, version_name: str, manifest: IngestionManifest):
+        """Index everything into version_name and swap the read alias onto it only once it is complete"""
+        indexed, failed = await self._index_openfda_data(ctx, openfda_service, version_name, manifest)
+
+        if failed:
+            ctx.logger.error(f"{failed} documents failed to index into {version_name}. It will be resumed on the next start.")
+            return
+
+        keep_versions = EnvLoader.get_int("OPENFDA_KEEP_VERSIONS", 1)
+        expected_count = manifest.total_docs()
+        if await openfda_service.promote_index(version_name, expected_count=expected_count, keep_versions=keep_versions):
+            ctx.logger.info(f"Serving {expected_count} documents from {version_name}")
     
-    async def _index_openfda_data(self, ctx: Context, openfda_service: OpenFDAService):
+    def _openfda_files(self) -> list:
         openfda_dir = "./data/openfda/filtered"
-        json_files = [f for f in os.listdir(openfda_dir) if f.endswith('.json')]
-        ctx.logger.info(f"Found {len(json_files)} JSON files to index")
+        json_files = [f for f in os.listdir(openfda_dir) if f.endswith(('.json', '.json.zip'))]
+        return [os.path.join(openfda_dir, json_file) for json_file in sorted(json_files)]
+
+    async def _index_openfda_data(self, ctx: Context, openfda_service: OpenFDAService, index_name: str, manifest: IngestionManifest) -> tuple:
+        file_paths = self._openfda_files()
+        ctx.logger.info(f"Found {len(file_paths)} JSON files to index")
         
-        for json_file in sorted(json_files):
-            file_path = os.path.join(openfda_dir, json_file)
-            ctx.logger.info(f"Indexing {json_file}...")
-            openfda_service.index_data(file_path=file_path)
+        workers = EnvLoader.get_int("OPENFDA_INGEST_WORKERS", 1)
+        if workers == 0:
+            workers = os.cpu_count() or 1
+
+        return await openfda_service.sync_files(file_paths, index_name=index_name, manifest=manifest, workers=workers)
     
     def run(self):
         self.agent.run()
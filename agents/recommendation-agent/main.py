@@ -1,7 +1,9 @@
 from uuid import uuid4
 from datetime import datetime
 
-from agent import RecommendationAgent
+from agent import ERROR_ANSWER, OVERLOADED_ANSWER, UNAVAILABLE_ANSWER, RecommendationAgent
+from services import RequestPoolOverloaded
+from services.resilience import CircuitOpenError
 from models.api import RecommendationAgentRequest, RecommendationAgentResponse
 
 from uagents import Context, Protocol
@@ -40,21 +42,35 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         if isinstance(item, TextContent):
             text += item.text
 
-    response = "I am afraid something went wrong and I am unable to answer your question at the moment"
+    async def answer():
+        response = RecommendationAgentResponse(answer=ERROR_ANSWER, medicines=[])
+        try:
+            request = RecommendationAgentRequest(question=text)
+            recommendation_result = await agent.recommendation_service.send_query(request.question)
+            response = RecommendationAgentResponse(answer=recommendation_result[0], medicines=recommendation_result[1])
+        except CircuitOpenError as e:
+            ctx.logger.warning(f"Failing fast: {e}")
+            response = RecommendationAgentResponse(answer=UNAVAILABLE_ANSWER, medicines=[])
+        except:
+            ctx.logger.exception("Error querying model")
+
+        await send_text(ctx, sender, response.answer)
+
+    # Answered by a request pool worker, so other messages are handled meanwhile
     try:
-        request = RecommendationAgentRequest(question=text)
-        recommendation_result = agent.recommendation_service.send_query(request.question)
-        response = RecommendationAgentResponse(answer=recommendation_result[0], medicines=recommendation_result[1])
-    except:
-        ctx.logger.exception("Error querying model")
+        agent.request_pool.submit(answer)
+    except RequestPoolOverloaded:
+        ctx.logger.warning(f"Rejecting chat message from {sender}, the request pool is full")
+        await send_text(ctx, sender, OVERLOADED_ANSWER)
 
+async def send_text(ctx: Context, sender: str, text: str):
     await ctx.send(
         sender,
         ChatMessage(
             timestamp=datetime.utcnow(),
             msg_id=uuid4(),
             content=[
-                TextContent(type="text", text=response.answer),
+                TextContent(type="text", text=text),
                 # EndSessionContent(type="end-session"),
             ],
         ),
@@ -1,4 +1,6 @@
 from .recommendation_agent_request import RecommendationAgentRequest
 from .recommendation_agent_response import RecommendationAgentResponse
+from .resilience_state_response import ResilienceStateResponse
+from .es_health_response import EsHealthResponse
 
-__all__ = ["RecommendationAgentRequest", "RecommendationAgentResponse"]
\ No newline at end of file
+__all__ = ["RecommendationAgentRequest", "RecommendationAgentResponse", "ResilienceStateResponse", "EsHealthResponse"]
\ No newline at end of file
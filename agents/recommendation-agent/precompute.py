@@ -0,0 +1,31 @@
+import asyncio
+from config import EnvLoader
+from services import RecommendationService, close_es_client
+from services.recommendation_precompute import current_index_version, load_disease_names, precompute_recommendations
+from dotenv import load_dotenv
+
+load_dotenv()
+
+async def main():
+    """Fill the recommendation table for every disease of the medical dataset against the live openFDA index"""
+    service = RecommendationService()
+    try:
+        index_version = await current_index_version(service.openfda_service)
+        if index_version is None:
+            print("The openFDA index has not been built yet, nothing to precompute")
+            return
+
+        service.recommendation_table.use_version(index_version)
+        questions = await asyncio.to_thread(load_disease_names)
+        await precompute_recommendations(
+            service,
+            service.recommendation_table,
+            index_version,
+            questions,
+            concurrency=EnvLoader.get_int("RECOMMENDATION_PRECOMPUTE_CONCURRENCY", 2)
+        )
+    finally:
+        await close_es_client()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,7 @@
+from .es_client import get_es_client, close_es_client, es_health_stats
+from .ingestion_manifest import IngestionManifest
 from .openfda_service import OpenFDAService
 from .recommendation_service import RecommendationService
+from .request_pool import RequestPool, RequestPoolOverloaded
 
-__all__ = ["OpenFDAService", "RecommendationService"]
\ No newline at end of file
+__all__ = ["get_es_client", "close_es_client", "es_health_stats", "IngestionManifest", "OpenFDAService", "RecommendationService", "RequestPool", "RequestPoolOverloaded"]
\ No newline at end of file
@@ -0,0 +1,82 @@
+import math
+from typing import Any, Dict, List, Tuple
+
+class ContextBuilder:
+    """
+    Builds the prompt context for RecommendationService from search hits.
+
+    Instead of dumping every hit as a whole, each hit contributes its name
+    fields plus the highlighted passages Elasticsearch matched against the
+    query, trimmed so the whole context stays under token_budget. Tokens are
+    estimated from the character count.
+    """
+    HEADER_FIELDS = [
+        ("Brand Name", "brand_name"),
+        ("Generic Name", "generic_name"),
+        ("Manufacturer", "manufacturer_name"),
+        ("Route", "route"),
+        ("Product Type", "product_type"),
+    ]
+
+    def __init__(self, token_budget: int, chars_per_token: int = 4, max_field_chars: int = 200):
+        self.token_budget = token_budget
+        self.chars_per_token = chars_per_token
+        self.max_field_chars = max_field_chars
+
+    def estimate_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def _trim(self, text: str, max_chars: int) -> str:
+        if len(text) <= max_chars:
+            return text
+        if max_chars <= 3:
+            return ""
+        return text[:max_chars - 3].rstrip() + "..."
+
+    def _format_header(self, result: Dict[str, Any]) -> str:
+        lines = []
+        for label, field in self.HEADER_FIELDS:
+            value = result.get(field)
+            if isinstance(value, list):
+                value = ", ".join(str(item) for item in value if item)
+            if value:
+                lines.append(f"{label}: {self._trim(str(value), self.max_field_chars)}")
+        return "\n".join(lines)
+
+    def _format_hit(self, result: Dict[str, Any], max_chars: int) -> str:
+        header = self._format_header(result)
+        remaining = max_chars - len(header) - len("\nRelevant passages:\n")
+
+        passages = []
+        for passage in result.get("highlights", []):
+            passage = " ".join(passage.split())
+            line = f"- {passage}"
+            if remaining <= len("- ..."):
+                break
+            line = self._trim(line, remaining)
+            passages.append(line)
+            remaining -= len(line) + 1
+
+        if not passages:
+            return self._trim(header, max_chars)
+
+        return header + "\nRelevant passages:\n" + "\n".join(passages)
+
+    def build(self, search_results: List[Dict[str, Any]]) -> Tuple[str, int]:
+        """
+        Returns:
+            tuple: The context text and its estimated token count.
+        """
+        if not search_results:
+            return "", 0
+
+        separator = "\n\n"
+        budget_chars = self.token_budget * self.chars_per_token
+        per_hit_chars = max(0, budget_chars // len(search_results) - len(separator) - len("Document 00:\n"))
+
+        documents = [
+            f"Document {i + 1}:\n{self._format_hit(result, per_hit_chars)}"
+            for i, result in enumerate(search_results)
+        ]
+        context = separator.join(documents)
+        return context, self.estimate_tokens(context)
@@ -0,0 +1,52 @@
+import time
+from typing import Any, Dict
+from elasticsearch import AsyncElasticsearch
+from config import EnvLoader
+
+_client: AsyncElasticsearch | None = None
+
+def get_es_client() -> AsyncElasticsearch:
+    """
+    The one pooled AsyncElasticsearch client of this agent. Connections are
+    kept alive and reused by every caller, up to OPENFDA_CONNECTIONS_PER_NODE per node.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncElasticsearch(
+            EnvLoader.get_str("OPENFDA_URL"),
+            connections_per_node=EnvLoader.get_int("OPENFDA_CONNECTIONS_PER_NODE", 10),
+            request_timeout=EnvLoader.get_float("OPENFDA_REQUEST_TIMEOUT", 30.0),
+            max_retries=EnvLoader.get_int("OPENFDA_MAX_RETRIES", 3),
+            retry_on_timeout=True,
+            http_compress=True,
+        )
+
+    return _client
+
+async def close_es_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+async def es_health_stats() -> Dict[str, Any]:
+    """Pool configuration and a timed round trip to the cluster health API"""
+    stats: Dict[str, Any] = {
+        "connections_per_node": EnvLoader.get_int("OPENFDA_CONNECTIONS_PER_NODE", 10),
+        "max_retries": EnvLoader.get_int("OPENFDA_MAX_RETRIES", 3),
+        "request_timeout": EnvLoader.get_float("OPENFDA_REQUEST_TIMEOUT", 30.0),
+    }
+
+    start = time.perf_counter()
+    try:
+        health = await get_es_client().cluster.health()
+        stats["cluster_status"] = health["status"]
+        stats["nodes"] = health["number_of_nodes"]
+        stats["data_nodes"] = health["number_of_data_nodes"]
+        stats["unassigned_shards"] = health["unassigned_shards"]
+    except Exception as e:
+        stats["cluster_status"] = "unreachable"
+        stats["error"] = str(e)
+    stats["health_latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    return stats
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Set, Tuple
+
+class IngestionManifest:
+    """
+    Persisted record of which openFDA files have been indexed into which index version.
+
+    Every file entry holds its size, modification time, content hash, the
+    number of documents it indexed, whether it completed, and the brand and
+    generic names it contributed (needed to rebuild the dedup state when
+    ingestion resumes). The manifest is rewritten atomically after every file.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.index_name: str | None = None
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable ingestion manifest at {self.path}: {e}")
+            return
+
+        self.index_name = data.get('index_name')
+        self.files = data.get('files', {})
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump({'index_name': self.index_name, 'files': self.files}, f)
+        os.replace(temporary_path, self.path)
+
+    def reset(self, index_name: str):
+        """Start tracking a fresh index version"""
+        self.index_name = index_name
+        self.files = {}
+        self.save()
+
+    @staticmethod
+    def file_key(file_path: str) -> str:
+        return os.path.basename(file_path)
+
+    def fingerprint(self, file_path: str) -> Dict[str, Any]:
+        """
+        Size, modification time and SHA-256 of file_path. The hash is reused
+        from the manifest when size and modification time are unchanged.
+        """
+        stat = os.stat(file_path)
+        entry = self.files.get(self.file_key(file_path))
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': entry['sha256']}
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+
+        return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest.hexdigest()}
+
+    def status(self, file_path: str, fingerprint: Dict[str, Any]) -> str:
+        """
+        Returns:
+            str: "completed", "changed" (completed with different content),
+            "incomplete" (started but never finished) or "new".
+        """
+        entry = self.files.get(self.file_key(file_path))
+        if entry is None:
+            return "new"
+
+        if not entry.get('completed'):
+            return "incomplete"
+
+        if entry.get('sha256') != fingerprint['sha256'] or entry.get('size') != fingerprint['size']:
+            return "changed"
+
+        return "completed"
+
+    def mark_started(self, file_path: str, fingerprint: Dict[str, Any]):
+        self.files[self.file_key(file_path)] = {
+            'path': file_path,
+            **fingerprint,
+            'docs_indexed': 0,
+            'completed': False,
+            'brand_names': [],
+            'generic_names': [],
+        }
+        self.save()
+
+    def mark_completed(self, file_path: str, docs_indexed: int, brand_names: Set[str], generic_names: Set[str]):
+        entry = self.files[self.file_key(file_path)]
+        entry['docs_indexed'] = docs_indexed
+        entry['completed'] = True
+        entry['brand_names'] = sorted(brand_names)
+        entry['generic_names'] = sorted(generic_names)
+        self.save()
+
+    def removed_files(self, file_paths: List[str]) -> List[str]:
+        """Keys of the manifest files that are no longer among file_paths"""
+        present = {self.file_key(file_path) for file_path in file_paths}
+        return [key for key in self.files if key not in present]
+
+    def forget(self, file_keys: List[str]):
+        for key in file_keys:
+            self.files.pop(self.file_key(key), None)
+        self.save()
+
+    def fork(self, index_name: str, drop: List[str] = ()):
+        """
+        Track index_name, a copy of the current version without the documents
+        of drop, keeping the entries of every other file.
+        """
+        self.index_name = index_name
+        self.forget(list(drop))
+
+    def seen_names(self, exclude: List[str] = ()) -> Tuple[Set[str], Set[str]]:
+        """Brand and generic names contributed by every completed file not in exclude"""
+        excluded = {self.file_key(file_path) for file_path in exclude}
+        brand_names: Set[str] = set()
+        generic_names: Set[str] = set()
+
+        for key, entry in self.files.items():
+            if key in excluded or not entry.get('completed'):
+                continue
+            brand_names.update(entry.get('brand_names', []))
+            generic_names.update(entry.get('generic_names', []))
+
+        return brand_names, generic_names
+
+    def total_docs(self) -> int:
+        return sum(entry.get('docs_indexed', 0) for entry in self.files.values() if entry.get('completed'))
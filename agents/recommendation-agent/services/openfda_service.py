@@ -1,41 +1,180 @@
 from config import EnvLoader
-import json
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
-from typing import Iterator, Dict, Any, Set
+import os
+import pickle
+import shutil
+import tempfile
+import zipfile
+import ijson
+import asyncio
+from elasticsearch.helpers import async_bulk
+from typing import AsyncIterator, Iterable, Iterator, Dict, Any, List, Set, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from services.es_client import get_es_client
+from services.ingestion_manifest import IngestionManifest
+from services.original_document_store import OriginalDocumentStore, compress_document
+from datetime import datetime, timezone
 import time
 
+TEXT_FIELDS_TO_COMBINE = [
+    'indications_and_usage', 'dosage_and_administration', 'warnings',
+    'active_ingredient', 'inactive_ingredient', 'purpose', 'description',
+    'adverse_reactions', 'contraindications', 'drug_interactions',
+    'clinical_pharmacology', 'boxed_warning', 'stop_use', 'do_not_use'
+]
+
+# Normalized brand names, normalized generic names, the document source and
+# the compressed raw label of one label
+Candidate = Tuple[Set[str], Set[str], Dict[str, Any], bytes]
+
+def iter_label_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the label records of an openFDA file one at a time, parsing the
+    `results` array incrementally. Zipped shards are read directly from
+    the archive without extracting them.
+    """
+    if file_path.endswith('.zip'):
+        with zipfile.ZipFile(file_path) as archive:
+            for member in archive.namelist():
+                if member.endswith('.json'):
+                    with archive.open(member) as f:
+                        yield from ijson.items(f, 'results.item', use_float=True)
+        return
+
+    with open(file_path, 'rb') as f:
+        yield from ijson.items(f, 'results.item', use_float=True)
+
+def transform_record(record: Dict[str, Any]) -> Candidate | None:
+    """Turn a label record into an index candidate, or None when it has no usable name"""
+    openfda = record.get('openfda', {})
+
+    brand_names = openfda.get('brand_name', [])
+    generic_names = openfda.get('generic_name', [])
+
+    normalized_brand_names = {name.lower().strip() for name in brand_names if name and name.strip()}
+    normalized_generic_names = {name.lower().strip() for name in generic_names if name and name.strip()}
+
+    if not normalized_brand_names and not normalized_generic_names:
+        return None
+
+    searchable_content = []
+    for field in TEXT_FIELDS_TO_COMBINE:
+        content = record.get(field)
+        if content and isinstance(content, list):
+            searchable_content.extend(content)
+
+    source = {
+        "searchable_text": " ".join(searchable_content),
+        "brand_name": openfda.get('brand_name', []),
+        "generic_name": openfda.get('generic_name', []),
+        "manufacturer_name": openfda.get('manufacturer_name', []),
+        "product_ndc": openfda.get('product_ndc', []),
+        "route": openfda.get('route', []),
+        "product_type": openfda.get('product_type', []),
+        "set_id": record.get('set_id')
+    }
+    return normalized_brand_names, normalized_generic_names, source, compress_document(record)
+
+def transform_records(records: Iterable[Dict[str, Any]]) -> Iterator[Candidate]:
+    for record in records:
+        candidate = transform_record(record)
+        if candidate is not None:
+            yield candidate
+
+SPOOL_BATCH_SIZE = 500
+
+def transform_shard(file_path: str, spool_dir: str) -> str | None:
+    """
+    Parse and transform a shard into a spool file in spool_dir, in pickled
+    batches of SPOOL_BATCH_SIZE candidates. Runs in a worker process. Only the
+    spool path goes back to the parent, so neither the candidates nor their raw
+    labels cross the process boundary, and memory stays bounded by one batch
+    whatever the shard size.
+
+    Returns:
+        str: The spool file path, or None when the shard does not exist.
+    """
+    if not os.path.exists(file_path):
+        print(f"File was not found at {file_path}")
+        return None
+
+    batch: List[Candidate] = []
+    with tempfile.NamedTemporaryFile(dir=spool_dir, suffix=".spool", delete=False) as spool:
+        for candidate in transform_records(iter_label_records(file_path)):
+            batch.append(candidate)
+            if len(batch) >= SPOOL_BATCH_SIZE:
+                pickle.dump(batch, spool, protocol=pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, spool, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return spool.name
+
+def read_spool(spool_path: str | None) -> Iterator[Candidate]:
+    """Stream the candidates of a transform_shard spool file back one batch at a time, then delete it"""
+    if spool_path is None:
+        return
+
+    try:
+        with open(spool_path, 'rb') as spool:
+            while True:
+                try:
+                    batch = pickle.load(spool)
+                except EOFError:
+                    break
+                yield from batch
+    finally:
+        os.remove(spool_path)
+
 class OpenFDAService:
     def __init__(self):
         self.es_host = EnvLoader.get_str("OPENFDA_URL")
-        self.es_client = Elasticsearch(self.es_host, request_timeout=30)
+        self.es_client = get_es_client()
         self.index_name = EnvLoader.get_str("OPENFDA_INDEX")
         
         self.seen_brand_names: Set[str] = set()
         self.seen_generic_names: Set[str] = set()
 
-    def check_connection(self) -> bool:
+        self.originals_path = EnvLoader.get_str("OPENFDA_ORIGINALS_PATH", "./state/openfda_originals.db")
+        self._original_store: OriginalDocumentStore | None = None
+
+    @property
+    def original_store(self) -> OriginalDocumentStore:
+        if self._original_store is None:
+            self._original_store = OriginalDocumentStore(self.originals_path)
+        return self._original_store
+
+    def get_original(self, set_id: str) -> Dict[str, Any] | None:
+        """The raw openFDA label of set_id, read lazily from the compressed side store"""
+        return self.original_store.get(set_id)
+
+    async def check_connection(self) -> bool:
         max_retries = 30
         retry_delay = 2
         
         for attempt in range(max_retries):
             try:
-                self.es_client.cluster.health(timeout="1s")
+                await self.es_client.cluster.health(timeout="1s")
                 print("Connected to Elasticsearch!")
                 return True
             except Exception as e:
                 if attempt < max_retries - 1:
                     print(f"Connection attempt {attempt + 1}/{max_retries} failed, retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                 else:
                     print(f"Connection failed after {max_retries} attempts: {e}")
                     return False
         return False
         
-    def create_index(self):
-        if self.es_client.indices.exists(index=self.index_name):
-            print(f"Index '{self.index_name}' already exists. Deleting it...")
-            self.es_client.indices.delete(index=self.index_name)
+    async def create_index(self) -> str:
+        """
+        Create a new timestamped version of the index. The live index behind
+        the read alias is left untouched until promote_index moves the alias.
+
+        Returns:
+            str: The name of the new versioned index.
+        """
+        version_name = f"{self.index_name}-v{datetime.now(timezone.utc):%Y%m%d%H%M%S%f}"
 
         mapping = {
             "mappings": {
@@ -55,92 +194,116 @@ class OpenFDAService:
                     "route": {"type": "keyword"},
                     "product_type": {"type": "keyword"},
                     "set_id": {"type": "keyword"},
-
-                    "original_document": {"type": "object", "enabled": False} # prevent indexing
+                    "source_file": {"type": "keyword"}
                 }
             }
         }
 
-        print(f"Creating new index '{self.index_name}'...")
-        self.es_client.indices.create(index=self.index_name, body=mapping)
+        print(f"Creating new index version '{version_name}'...")
+        await self.es_client.indices.create(index=version_name, body=mapping)
         
         self.seen_brand_names.clear()
         self.seen_generic_names.clear()
 
+        return version_name
+
+    async def alias_exists(self) -> bool:
+        return bool(await self.es_client.indices.exists_alias(name=self.index_name))
+
+    async def get_alias_targets(self) -> List[str]:
+        if not await self.alias_exists():
+            return []
+        aliases = await self.es_client.indices.get_alias(name=self.index_name)
+        return list(aliases.keys())
+
+    async def promote_index(self, version_name: str, expected_count: int, keep_versions: int = 1) -> bool:
+        """
+        Verify the document count of version_name, atomically move the read
+        alias onto it and delete old versions beyond keep_versions. A version
+        that fails verification is deleted and the alias is left as it was.
+        """
+        await self.es_client.indices.refresh(index=version_name)
+        count = (await self.es_client.count(index=version_name))['count']
+        if count != expected_count:
+            print(f"Index '{version_name}' holds {count} documents, expected {expected_count}. Not promoting it.")
+            await self.es_client.indices.delete(index=version_name)
+            return False
+
+        actions = [{"remove": {"index": index, "alias": self.index_name}} for index in await self.get_alias_targets()]
+        if await self.es_client.indices.exists(index=self.index_name) and not await self.alias_exists():
+            # A concrete index from before versioning still holds the alias name
+            actions.append({"remove_index": {"index": self.index_name}})
+        actions.append({"add": {"index": version_name, "alias": self.index_name}})
+
+        await self.es_client.indices.update_aliases(actions=actions)
+        print(f"Alias '{self.index_name}' now points to '{version_name}'")
+
+        await self._collect_old_versions(keep_versions)
+        return True
+
+    async def _collect_old_versions(self, keep_versions: int):
+        live = set(await self.get_alias_targets())
+        versions = sorted((await self.es_client.indices.get(index=f"{self.index_name}-v*", expand_wildcards="open")).keys())
+        previous = [index for index in versions if index not in live]
+        stale = previous[:-keep_versions] if keep_versions > 0 else previous
+
+        for index in stale:
+            print(f"Deleting old index version '{index}'...")
+            await self.es_client.indices.delete(index=index)
+
     def _normalize_name(self, name_list):
         if not name_list:
             return set()
         return {name.lower().strip() for name in name_list if name and name.strip()}
 
-    def _generate_documents(self, file_path: str) -> Iterator[Dict[str, Any]]:
-        try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-        except FileNotFoundError:
+    def _deduplicate(self, candidates: Iterable[Candidate], contributed: Tuple[Set[str], Set[str]] | None = None) -> Iterator[Dict[str, Any]]:
+        """
+        Drop labels whose brand or generic name was already indexed. This is the
+        only order dependent step, so it always runs in the parent process, in
+        file order. The names of the labels that are kept are also added to
+        contributed, when given, and their raw labels go to the side store.
+        """
+        for brand_names, generic_names, source, compressed_original in candidates:
+            if brand_names & self.seen_brand_names:
+                continue
+
+            if generic_names & self.seen_generic_names:
+                continue
+
+            self.seen_brand_names.update(brand_names)
+            self.seen_generic_names.update(generic_names)
+            if contributed is not None:
+                contributed[0].update(brand_names)
+                contributed[1].update(generic_names)
+
+            if source.get("set_id"):
+                self.original_store.put(source["set_id"], compressed_original)
+            yield source
+
+    def _to_action(self, index_name: str, file_path: str, source: Dict[str, Any]) -> Dict[str, Any]:
+        # set_id doubles as the document id, so indexing a file again overwrites
+        # its documents instead of duplicating them
+        action = {"_index": index_name, "_source": {**source, "source_file": os.path.basename(file_path)}}
+        if source.get("set_id"):
+            action["_id"] = source["set_id"]
+        return action
+
+    def _generate_documents(self, file_path: str, index_name: str, contributed: Tuple[Set[str], Set[str]] | None = None) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(file_path):
             print(f"File was not found at {file_path}")
             return
 
-        records = data.get('results', [])
-        print(f"Processing {len(records)} records from {file_path}...")
+        print(f"Processing records from {file_path}...")
+        for source in self._deduplicate(transform_records(iter_label_records(file_path)), contributed):
+            yield self._to_action(index_name, file_path, source)
 
-        for record in records:
-            openfda = record.get('openfda', {})
-            
-            brand_names = openfda.get('brand_name', [])
-            generic_names = openfda.get('generic_name', [])
-            
-            normalized_brand_names = {name.lower().strip() for name in brand_names if name and name.strip()}
-            normalized_generic_names = {name.lower().strip() for name in generic_names if name and name.strip()}
-            
-            if not normalized_brand_names and not normalized_generic_names:
-                continue
-            
-            if normalized_brand_names & self.seen_brand_names:
-                continue
-                
-            if normalized_generic_names & self.seen_generic_names:
-                continue
-            
-            self.seen_brand_names.update(normalized_brand_names)
-            self.seen_generic_names.update(normalized_generic_names)
-
-            text_fields_to_combine = [
-                'indications_and_usage', 'dosage_and_administration', 'warnings',
-                'active_ingredient', 'inactive_ingredient', 'purpose', 'description',
-                'adverse_reactions', 'contraindications', 'drug_interactions',
-                'clinical_pharmacology', 'boxed_warning', 'stop_use', 'do_not_use'
-            ]
-
-            searchable_content = []
-            for field in text_fields_to_combine:
-                content = record.get(field)
-                if content and isinstance(content, list):
-                    searchable_content.extend(content)
-
-            processed_doc = {
-                "_index": self.index_name,
-                "_source": {
-                    "searchable_text": " ".join(searchable_content),
-                    "brand_name": openfda.get('brand_name', []),
-                    "generic_name": openfda.get('generic_name', []),
-                    "manufacturer_name": openfda.get('manufacturer_name', []),
-                    "product_ndc": openfda.get('product_ndc', []),
-                    "route": openfda.get('route', []),
-                    "product_type": openfda.get('product_type', []),
-                    "set_id": record.get('set_id'),
-                    "original_document": record 
-                }
-            }
-            yield processed_doc
-
-    def index_data(self, file_path: str):
-        print(f"Starting to index data from '{file_path}'...")
+    async def _bulk_index(self, file_path: str, documents: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
         start_time = time.time()
 
         try:
-            success, errors = bulk(
+            success, errors = await async_bulk(
                 self.es_client,
-                self._generate_documents(file_path),
+                documents,
                 chunk_size=1000,
                 raise_on_error=False
             )
@@ -155,10 +318,173 @@ class OpenFDAService:
             if errors:
                 print("First 5 errors:", errors[:5])
 
+            return success, len(errors)
+
         except Exception as e:
             print(f"An error occurred during bulk indexing: {e}")
+            raise
+
+    async def index_data(self, file_path: str, index_name: str) -> Tuple[int, int]:
+        """
+        Index one openFDA file into index_name.
+
+        Returns:
+            tuple: The number of indexed and failed documents.
+        """
+        print(f"Starting to index data from '{file_path}' into '{index_name}'...")
+        result = await self._bulk_index(file_path, self._generate_documents(file_path, index_name))
+        self.original_store.flush()
+        return result
+
+    async def _transform_in_parallel(self, file_paths: List[str], workers: int) -> AsyncIterator[Tuple[str, Iterable[Candidate]]]:
+        """
+        Parse and transform shards in a process pool, yielding them back in
+        file_paths order. Workers spool their shards to temporary files, which
+        are streamed back a batch at a time, so memory does not grow with the
+        shard size. At most workers + 1 shards are spooled ahead, and the
+        event loop keeps running while they are awaited.
+        """
+        spool_dir = tempfile.mkdtemp(prefix="openfda-transform-")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for file_path in file_paths:
+                    pending.append((file_path, asyncio.wrap_future(pool.submit(transform_shard, file_path, spool_dir))))
+                    if len(pending) > workers:
+                        file_path, future = pending.popleft()
+                        yield file_path, read_spool(await future)
+
+                while pending:
+                    file_path, future = pending.popleft()
+                    yield file_path, read_spool(await future)
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    async def _transform_in_order(self, file_paths: List[str]) -> AsyncIterator[Tuple[str, Iterable[Candidate]]]:
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                print(f"File was not found at {file_path}")
+                yield file_path, []
+                continue
+
+            yield file_path, transform_records(iter_label_records(file_path))
+
+    async def index_files(self, file_paths: List[str], index_name: str, workers: int = 1, manifest: IngestionManifest | None = None) -> Tuple[int, int]:
+        """
+        Index several openFDA files into index_name. With more than one worker
+        the shards are parsed and transformed in parallel processes, while
+        deduplication still runs in file order here, so the resulting index is
+        the same as a serial build. When a manifest is given, every file is
+        recorded in it as started and then completed.
+
+        Returns:
+            tuple: The total number of indexed and failed documents.
+        """
+        total_indexed, total_failed = 0, 0
+
+        if workers > 1:
+            print(f"Transforming {len(file_paths)} files with {workers} worker processes...")
+            shards = self._transform_in_parallel(file_paths, workers)
+        else:
+            shards = self._transform_in_order(file_paths)
 
-    def search(self, query_text: str, top_n: int = 4) -> list:
+        async for file_path, candidates in shards:
+            print(f"Starting to index data from '{file_path}' into '{index_name}'...")
+            if manifest is not None and os.path.exists(file_path):
+                manifest.mark_started(file_path, manifest.fingerprint(file_path))
+
+            contributed = (set(), set())
+            documents = (self._to_action(index_name, file_path, source) for source in self._deduplicate(candidates, contributed))
+            indexed, failed = await self._bulk_index(file_path, documents)
+            self.original_store.flush()
+            total_indexed += indexed
+            total_failed += failed
+
+            if manifest is not None and not failed and os.path.exists(file_path):
+                manifest.mark_completed(file_path, indexed, *contributed)
+
+        return total_indexed, total_failed
+
+    def plan_sync(self, file_paths: List[str], manifest: IngestionManifest) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compare file_paths with the manifest.
+
+        Returns:
+            tuple: The files to (re)index because they are new, changed or were
+            interrupted, those of them that left documents behind, and the keys
+            of the manifest files that no longer exist.
+        """
+        pending, stale = [], []
+        for file_path in file_paths:
+            status = manifest.status(file_path, manifest.fingerprint(file_path))
+            if status == "completed":
+                continue
+
+            print(f"File '{file_path}' is {status}, it will be indexed")
+            pending.append(file_path)
+            if status in ("changed", "incomplete"):
+                stale.append(file_path)
+
+        removed = manifest.removed_files(file_paths)
+        for file_key in removed:
+            print(f"File '{file_key}' was removed, its documents will be deleted")
+
+        return pending, stale, removed
+
+    async def copy_index(self, source: str, dest: str, exclude_files: List[str] = ()):
+        """Copy every document of source into dest, except those of exclude_files"""
+        excluded = [os.path.basename(file_path) for file_path in exclude_files]
+        print(f"Copying '{source}' into '{dest}' without the documents of {len(excluded)} files...")
+        await self.es_client.options(request_timeout=3600).reindex(
+            source={"index": source, "query": {"bool": {"must_not": [{"terms": {"source_file": excluded}}]}}},
+            dest={"index": dest},
+            wait_for_completion=True,
+            refresh=True
+        )
+
+    async def sync_files(self, file_paths: List[str], index_name: str, manifest: IngestionManifest, workers: int = 1) -> Tuple[int, int]:
+        """
+        Bring index_name, a version that is not live, up to date with file_paths
+        using the manifest: files that completed with the same content are
+        skipped, files that are new, changed or were interrupted are
+        (re)indexed. Documents left behind by changed, interrupted or removed
+        files are deleted first, and the dedup state is rebuilt from the names
+        of every other completed file. The live version is never written to,
+        changes reach it through a new version and promote_index.
+
+        Returns:
+            tuple: The number of indexed and failed documents of this run.
+        """
+        if index_name in await self.get_alias_targets():
+            raise ValueError(f"'{index_name}' is live, sync a new version and promote it instead")
+
+        pending, stale, removed = self.plan_sync(file_paths, manifest)
+        if not pending and not removed:
+            print("Every file in the manifest is already indexed")
+            return 0, 0
+
+        for file_name in [os.path.basename(file_path) for file_path in stale] + removed:
+            await self.es_client.delete_by_query(
+                index=index_name,
+                query={"term": {"source_file": file_name}},
+                refresh=True,
+                conflicts="proceed"
+            )
+        manifest.forget(removed)
+
+        if not pending:
+            return 0, 0
+
+        self.seen_brand_names, self.seen_generic_names = manifest.seen_names(exclude=pending)
+        return await self.index_files(pending, index_name=index_name, workers=workers, manifest=manifest)
+
+    async def search(self, query_text: str, top_n: int = 4, fragment_size: int = 300, number_of_fragments: int = 5) -> list:
+        """
+        Search the read alias. Instead of the full searchable_text, every
+        result carries the passages relevant to the query under `highlights`,
+        best first.
+        """
+        # index_name is the read alias, so searches never see a version being built
         print(f"Searching for {query_text}...")
 
         query = {
@@ -169,13 +495,28 @@ class OpenFDAService:
                 }
             },
             "_source": {
-                "excludes": ["original_document"]
+                "excludes": ["searchable_text"]
+            },
+            "highlight": {
+                "pre_tags": [""],
+                "post_tags": [""],
+                "fields": {
+                    "searchable_text": {
+                        "fragment_size": fragment_size,
+                        "number_of_fragments": number_of_fragments,
+                        "order": "score"
+                    }
+                }
             }
         }
 
         try:
-            response = self.es_client.search(index=self.index_name, body=query)
-            results = [hit['_source'] for hit in response['hits']['hits']]
+            response = await self.es_client.search(index=self.index_name, body=query)
+            results = []
+            for hit in response['hits']['hits']:
+                result = hit['_source']
+                result['highlights'] = hit.get('highlight', {}).get('searchable_text', [])
+                results.append(result)
             return results
         except Exception as e:
             print(f"Error when searching: {e}")
@@ -0,0 +1,69 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, List, Tuple
+
+def compress_document(document: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(document, separators=(',', ':')).encode('utf-8'), 6)
+
+def decompress_document(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+class OriginalDocumentStore:
+    """
+    Local key-value store for the raw openFDA labels, keyed by set_id.
+
+    Labels are stored zlib compressed in SQLite, so the search index only has
+    to carry the fields we query. Writes are buffered and flushed in batches.
+    """
+    def __init__(self, path: str, batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending: List[Tuple[str, bytes]] = []
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS original_documents (set_id TEXT PRIMARY KEY, document BLOB NOT NULL)"
+        )
+        self._connection.commit()
+
+    def put(self, set_id: str, compressed_document: bytes):
+        """Queue an already compressed document, see compress_document"""
+        with self._lock:
+            self._pending.append((set_id, compressed_document))
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO original_documents (set_id, document) VALUES (?, ?)",
+            self._pending
+        )
+        self._connection.commit()
+        self._pending = []
+
+    def get(self, set_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT document FROM original_documents WHERE set_id = ?", (set_id,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return decompress_document(row[0])
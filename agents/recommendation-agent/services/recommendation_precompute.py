@@ -0,0 +1,78 @@
+import asyncio
+from typing import List, Tuple
+from services.openfda_service import OpenFDAService
+from services.recommendation_service import NO_MATCH_ANSWER, RecommendationService
+from services.recommendation_table import RecommendationTable
+
+def load_disease_names() -> List[str]:
+    """
+    The disease names of the medical dataset, which are the only questions the
+    diagnosis agent ever sends. Duplicates are dropped, order is kept.
+    """
+    from datasets import load_dataset
+
+    dataset = load_dataset("QuyenAnhDE/Diseases_Symptoms", split="train", streaming=True)
+    names = {}
+    for row in dataset:
+        name = (row.get("Name") or "").strip()
+        if name:
+            names.setdefault(name, None)
+    return list(names)
+
+def is_storable(answer: str | None, medicines: list) -> bool:
+    """Whether an answer is worth serving for a whole index version: not empty, not a refusal, with medicines"""
+    return bool(answer and answer.strip()) and NO_MATCH_ANSWER not in answer and bool(medicines)
+
+async def current_index_version(openfda_service: OpenFDAService) -> str | None:
+    """The concrete index version(s) behind the openFDA read alias"""
+    targets = await openfda_service.get_alias_targets()
+    if not targets:
+        return None
+    return ",".join(sorted(targets))
+
+async def precompute_recommendations(
+    service: RecommendationService,
+    table: RecommendationTable,
+    index_version: str,
+    questions: List[str],
+    concurrency: int = 2
+) -> Tuple[int, int]:
+    """
+    Generate and store the answer of every question that has no row for
+    index_version yet, at most concurrency at a time.
+
+    Returns:
+        tuple: The number of stored and failed questions.
+    """
+    done = await asyncio.to_thread(table.questions_for_version, index_version)
+    pending = {}
+    for question in questions:
+        key = service.normalize_question(question)
+        if key not in done:
+            pending.setdefault(key, question)
+
+    print(f"Precomputing {len(pending)} of {len(questions)} recommendations for index version {index_version}")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    stored, failed, skipped = 0, 0, 0
+
+    async def precompute(key: str, question: str):
+        nonlocal stored, failed, skipped
+        async with semaphore:
+            try:
+                answer, medicines = await service.compute_answer(question)
+            except Exception as e:
+                failed += 1
+                print(f"Failed to precompute the recommendation for '{question}': {e}")
+                return
+
+        if not is_storable(answer, medicines):
+            # Answered live next time, the openFDA data may cover it by then
+            skipped += 1
+            return
+
+        await asyncio.to_thread(table.put, key, index_version, answer, medicines)
+        stored += 1
+
+    await asyncio.gather(*(precompute(key, question) for key, question in pending.items()))
+    print(f"Precomputed {stored} recommendations for index version {index_version}, {skipped} without a usable answer, {failed} failed")
+    return stored, failed
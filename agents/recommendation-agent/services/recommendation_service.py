@@ -1,15 +1,47 @@
+import asyncio
 import textwrap
+from typing import Any, Dict
 from config import EnvLoader
 from google import genai
 from services import OpenFDAService
+from services.context_builder import ContextBuilder
+from services.lru_cache import LRUCache
+from services.metrics import registry, register_cache, timed
+from services.recommendation_table import RecommendationTable
+from services.resilience import get_endpoint
 from models.domain import Medicine
 
+NO_MATCH_ANSWER = "I'm sorry, I can't find a suitable medicine for your situation. Please consult with a doctor or healthcare professional for proper advice."
+
 class RecommendationService:
     def __init__(self):
         self.model_name = EnvLoader.get_str("MODEL_NAME")
         self.api_key = EnvLoader.get_str("GEMINI_API_KEY")
         self.client = genai.Client(api_key=self.api_key)
         self.openfda_service = OpenFDAService()
+        self.gemini_endpoint = get_endpoint(
+            "gemini",
+            max_attempts=EnvLoader.get_int("RESILIENCE_MAX_ATTEMPTS", 3),
+            base_delay=EnvLoader.get_float("RESILIENCE_BASE_DELAY", 0.2),
+            max_delay=EnvLoader.get_float("RESILIENCE_MAX_DELAY", 5.0),
+            failure_threshold=EnvLoader.get_int("RESILIENCE_FAILURE_THRESHOLD", 5),
+            recovery_timeout=EnvLoader.get_float("RESILIENCE_RECOVERY_SECONDS", 30.0),
+            retry_budget_ratio=EnvLoader.get_float("RESILIENCE_RETRY_BUDGET_RATIO", 0.2),
+        )
+        self.context_builder = ContextBuilder(
+            token_budget=EnvLoader.get_int("RECOMMENDATION_CONTEXT_TOKEN_BUDGET", 2000)
+        )
+        self.result_cache = LRUCache(
+            max_entries=EnvLoader.get_int("RECOMMENDATION_CACHE_MAX_ENTRIES", 512),
+            ttl_seconds=EnvLoader.get_float("RECOMMENDATION_CACHE_TTL_SECONDS", 300.0)
+        )
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.recommendation_table = RecommendationTable(
+            EnvLoader.get_str("RECOMMENDATION_TABLE_PATH", "./state/recommendations.db")
+        )
+        self.coalesced = 0
+        self.answers = registry.counter("recommendation_answers_total", "Answered questions, by where the answer came from", ["source"])
+        register_cache("result", self.result_cache.stats)
 
     def _build_prompt(self, context: str, medicine_data: list, query: str) -> str:
         medicine_info = "\n".join([
@@ -29,7 +61,7 @@ class RecommendationService:
             3. Prescribe a suitable medicine from the available medicines that addresses the user's needs.
             4. Present the prescription in the EXACT format specified below.
             5. If multiple drugs from the context are suitable, list the best one first and briefly mention the others as alternatives.
-            6. If no document in the context is a suitable match for the user's query, you MUST respond with "I'm sorry, I can't find a suitable medicine for your situation. Please consult with a doctor or healthcare professional for proper advice." Do not use outside knowledge.
+            6. If no document in the context is a suitable match for the user's query, you MUST respond with "{NO_MATCH_ANSWER}" Do not use outside knowledge.
 
             ---
 
@@ -101,16 +133,83 @@ class RecommendationService:
         
         return medicines
 
-    def send_query(self, query: str) -> tuple:
-        search_results = self.openfda_service.search(query_text=query)
-        context = "\n\n".join([str(result) for result in search_results])
+    @staticmethod
+    def normalize_question(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    async def send_query(self, query: str) -> tuple:
+        """
+        Answer query, sharing the work between identical questions. Known
+        diseases are served from the precomputed recommendation table, a
+        recent answer from the result cache, and a question that is already
+        being answered waits for that computation instead of starting its own.
+
+        Returns:
+            tuple: The answer text and the list of recommended medicines.
+        """
+        key = self.normalize_question(query)
+        precomputed = self.recommendation_table.get(key)
+        if precomputed is not None:
+            self.answers.inc(source="precomputed")
+            return precomputed[0], list(precomputed[1])
+
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            print(f"Answering '{query}' from the result cache")
+            self.answers.inc(source="cache")
+            return cached[0], list(cached[1])
+
+        task = self._in_flight.get(key)
+        source = "coalesced" if task is not None else "computed"
+        if task is not None:
+            self.coalesced += 1
+            print(f"Waiting for the answer already being computed for '{query}'")
+        else:
+            # The computation is a task of its own, not part of the first caller,
+            # so cancelling any caller never cancels it for the others
+            task = asyncio.create_task(self.compute_answer(query))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish_in_flight(key, done))
+
+        response_text, medicine_list = await asyncio.shield(task)
+        self.answers.inc(source=source)
+        return response_text, list(medicine_list)
+
+    def _finish_in_flight(self, key: str, task: asyncio.Task):
+        del self._in_flight[key]
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self.result_cache.set(key, task.result())
+
+    def coalescing_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "coalesced": self.coalesced,
+            "result_cache": self.result_cache.stats(),
+            "precomputed": len(self.recommendation_table),
+        }
+
+    async def compute_answer(self, query: str) -> tuple:
+        """Search openFDA and generate the answer, bypassing every cache"""
+        search_results = await timed("search", self.openfda_service.search(query_text=query))
+        context, context_tokens = self.context_builder.build(search_results)
 
         medicine_list = self._extract_medicine_data(search_results)
         prompt = self._build_prompt(context, medicine_list, query)
+        print(
+            f"Prompt size for '{query}': {len(prompt)} chars, "
+            f"~{self.context_builder.estimate_tokens(prompt)} tokens "
+            f"({context_tokens} context tokens, budget {self.context_builder.token_budget})"
+        )
 
-        response = self.client.models.generate_content(
+        response = await timed("gemini", self.gemini_endpoint.call(lambda: self.client.aio.models.generate_content(
             model=self.model_name,
             contents=prompt
-        )
+        )))
+
+        usage = response.usage_metadata
+        if usage is not None and usage.prompt_token_count is not None:
+            print(f"Gemini counted {usage.prompt_token_count} prompt tokens for '{query}'")
 
         return response.text, medicine_list
\ No newline at end of file
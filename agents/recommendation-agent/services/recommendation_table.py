@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Set, Tuple
+from models.domain import Medicine
+
+class RecommendationTable:
+    """
+    Precomputed answers keyed by normalized question, stored in SQLite.
+
+    Every row remembers the openFDA index version it was generated against.
+    Only the rows of the version set with use_version are served, and they
+    are held in memory so a lookup is a single dict access. Rows of other
+    versions are deleted when a version is taken into use.
+
+    Every method runs SQLite, so coroutines call them through asyncio.to_thread.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.index_version: str | None = None
+        self._answers: Dict[str, Tuple[str, List[Medicine]]] = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS recommendations ("
+            "question TEXT PRIMARY KEY, index_version TEXT NOT NULL, "
+            "answer TEXT NOT NULL, medicines TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def use_version(self, index_version: str):
+        """Serve the rows generated against index_version, loading them into memory"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT question, answer, medicines FROM recommendations WHERE index_version = ?", (index_version,)
+            ).fetchall()
+            self._connection.execute("DELETE FROM recommendations WHERE index_version != ?", (index_version,))
+            self._connection.commit()
+
+        self._answers = {
+            question: (answer, [Medicine(**medicine) for medicine in json.loads(medicines)])
+            for question, answer, medicines in rows
+        }
+        self.index_version = index_version
+
+    def get(self, question: str) -> Tuple[str, List[Medicine]] | None:
+        """The precomputed answer of a normalized question, or None"""
+        return self._answers.get(question)
+
+    def put(self, question: str, index_version: str, answer: str, medicines: List[Medicine]):
+        serialized = json.dumps([medicine.dict() for medicine in medicines])
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO recommendations (question, index_version, answer, medicines, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (question, index_version, answer, serialized, time.time())
+            )
+            self._connection.commit()
+
+        if index_version == self.index_version:
+            self._answers[question] = (answer, list(medicines))
+
+    def questions_for_version(self, index_version: str) -> Set[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT question FROM recommendations WHERE index_version = ?", (index_version,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def __len__(self) -> int:
+        return len(self._answers)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List
+
+class RequestPoolOverloaded(Exception):
+    """Raised by RequestPool.submit when the queue is full"""
+
+class RequestPool:
+    """
+    Runs submitted jobs on a fixed number of asyncio workers.
+
+    Jobs wait in a bounded queue. When it is full, submit raises
+    RequestPoolOverloaded right away so the caller can answer with an overload
+    reply instead of letting requests pile up. The time every job spent in
+    the queue is recorded for stats().
+    """
+    def __init__(self, concurrency: int, max_queue_size: int, wait_window: int = 1000):
+        self.concurrency = max(1, concurrency)
+        self.max_queue_size = max(1, max_queue_size)
+        self._queue: asyncio.Queue | None = None
+        self._workers: List[asyncio.Task] = []
+        self._queue_waits = deque(maxlen=wait_window)
+
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """Start the workers on the running loop. Called by submit when needed"""
+        if self._workers:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def submit(self, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Queue job, a coroutine function without arguments.
+
+        Returns:
+            asyncio.Future: Resolves with the result of job once a worker ran it.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((job, time.perf_counter(), future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise RequestPoolOverloaded(f"{self._queue.qsize()} requests are already waiting")
+
+        return future
+
+    async def _worker(self):
+        while True:
+            job, enqueued_at, future = await self._queue.get()
+            self._queue_waits.append(time.perf_counter() - enqueued_at)
+            self.in_flight += 1
+            try:
+                result = await job()
+                self.processed += 1
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._queue_waits)
+        stats: Dict[str, Any] = {
+            "concurrency": self.concurrency,
+            "max_queue_size": self.max_queue_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queue_wait_avg_ms": 0.0,
+            "queue_wait_p95_ms": 0.0,
+            "queue_wait_max_ms": 0.0,
+        }
+        if waits:
+            stats["queue_wait_avg_ms"] = round(sum(waits) / len(waits) * 1000, 2)
+            stats["queue_wait_p95_ms"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2)
+            stats["queue_wait_max_ms"] = round(waits[-1] * 1000, 2)
+
+        return stats
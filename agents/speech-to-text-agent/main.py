@@ -1,15 +1,45 @@
+import asyncio
+import math
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from models.messages import AIRequest, AIResponse
 from config import ConfigLoader
+from resilience import CircuitOpenError, get_endpoint, resilience_state
 from openai import OpenAI
 from io import BytesIO
 import openai
 
 app = FastAPI(title="Speech Recognition API")
 config_loader = ConfigLoader()
+# Retries are left to whisper_endpoint, so the client does not retry on its own
 client = OpenAI(
-    api_key=config_loader.get_str("OPENAI_API_KEY")
+    api_key=config_loader.get_str("OPENAI_API_KEY"),
+    max_retries=0
 )
+whisper_endpoint = get_endpoint(
+    "whisper",
+    max_attempts=config_loader.get_int("RESILIENCE_MAX_ATTEMPTS", 3),
+    base_delay=config_loader.get_float("RESILIENCE_BASE_DELAY", 0.2),
+    max_delay=config_loader.get_float("RESILIENCE_MAX_DELAY", 5.0),
+    failure_threshold=config_loader.get_int("RESILIENCE_FAILURE_THRESHOLD", 5),
+    recovery_timeout=config_loader.get_float("RESILIENCE_RECOVERY_SECONDS", 30.0),
+    retry_budget_ratio=config_loader.get_float("RESILIENCE_RETRY_BUDGET_RATIO", 0.2),
+)
+
+def transcribe(audio_file: bytes, filename: str, language: str | None):
+    # A fresh buffer for every attempt, a retry has to read the audio from the start
+    audio_buffer = BytesIO(audio_file)
+    audio_buffer.name = filename
+
+    return client.audio.transcriptions.create(
+        file=audio_buffer,
+        model="whisper-1",
+        language=language
+    )
+
+@app.get("/resilience")
+async def resilience():
+    """Circuit breaker, retry and retry budget state of the Whisper endpoint"""
+    return resilience_state()
 
 @app.post("/transcribe", response_model=AIResponse)
 async def transcribe_audio(
@@ -25,13 +55,17 @@ async def transcribe_audio(
     print(f"Received file: {file.filename}, size: {len(audio_file)} bytes")
 
     try:
-        audio_buffer = BytesIO(audio_file)
-        audio_buffer.name = file.filename
-        
-        transcription = client.audio.transcriptions.create(
-            file=audio_buffer,
-            model="whisper-1",
-            language=ai_request.language if ai_request.language else None
+        transcription = await whisper_endpoint.call(lambda: asyncio.to_thread(
+            transcribe,
+            audio_file,
+            file.filename,
+            ai_request.language if ai_request.language else None
+        ))
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Transcription service temporarily unavailable",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
         )
     except openai.BadRequestError as e:
         raise HTTPException(status_code=400, detail=f"Bad request: {str(e)}")
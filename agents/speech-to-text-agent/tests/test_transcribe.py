@@ -0,0 +1,49 @@
+import importlib
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+import resilience
+
+@pytest.fixture
+def speech_agent(fake_server, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_server.url)
+    monkeypatch.setenv("RESILIENCE_MAX_ATTEMPTS", "2")
+    monkeypatch.setenv("RESILIENCE_BASE_DELAY", "0")
+    monkeypatch.setenv("RESILIENCE_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("RESILIENCE_RECOVERY_SECONDS", "60")
+    # get_endpoint would hand back the endpoint of an earlier import
+    monkeypatch.setattr(resilience, "_endpoints", {})
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+    return importlib.import_module("main")
+
+def transcribe(client: TestClient):
+    return client.post("/transcribe", files={"file": ("audio.wav", b"RIFF0000WAVE", "audio/wav")})
+
+def test_transcription_is_retried(speech_agent, fake_server):
+    fake_server.script(503, body=b'{"text": "hello"}')
+    response = transcribe(TestClient(speech_agent.app))
+
+    assert response.status_code == 200
+    assert response.json()["text"] == "hello"
+    assert fake_server.hits == 2
+    assert speech_agent.whisper_endpoint.retries == 1
+
+def test_transcription_fails_fast_once_open(speech_agent, fake_server):
+    client = TestClient(speech_agent.app)
+
+    fake_server.script(503, 503)
+    assert transcribe(client).status_code == 500
+    assert fake_server.hits == 2
+
+    fake_server.script()
+    response = transcribe(client)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "60"
+    assert fake_server.hits == 0
+
+    state = client.get("/resilience").json()["whisper"]
+    assert state["state"] == "open"
+    assert state["rejected"] == 1